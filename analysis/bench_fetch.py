@@ -0,0 +1,174 @@
+import argparse
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+import requests
+
+from crimes_etl import get_chicago_crimes_data_since_latest_record
+from socrata_standin import (
+    CRIMES_TABLE_ID,
+    apply_upstream_changes,
+    make_socrata_standin_state,
+    start_socrata_standin,
+    stop_socrata_standin,
+)
+from utils import (
+    get_number_of_results_for_socrata_query,
+    get_socrata_table_records_updated_or_added_after_given_date,
+)
+
+
+def pull_full_crimes_table(socrata_domain: str, page_size: int) -> pd.DataFrame:
+    crimes_df = get_chicago_crimes_data_since_latest_record(
+        crimes_gdf=pd.DataFrame({"updated_on": [pd.Timestamp("1970-01-01")]}),
+        socrata_domain=socrata_domain,
+        scheme="http",
+        page_size=page_size,
+    )
+    return crimes_df
+
+
+def benchmark_fetch_throughput(
+    n_records: int, page_sizes: List[int], latencies: List[float], n_repeats: int = 3
+) -> pd.DataFrame:
+    benchmark_rows = []
+    for latency in latencies:
+        state = make_socrata_standin_state(n_crimes=n_records, n_violence=0, latency=latency)
+        server, socrata_domain = start_socrata_standin(state=state)
+        try:
+            for page_size in page_sizes:
+                count_seconds, pull_seconds = [], []
+                for _ in range(n_repeats):
+                    start = time.perf_counter()
+                    get_number_of_results_for_socrata_query(
+                        filter_str="$where=updated_on>'1970-01-01T00:00:00.000'",
+                        api_call_base=f"http://{socrata_domain}/resource/{CRIMES_TABLE_ID}.csv",
+                    )
+                    count_seconds.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    pulled_df = get_socrata_table_records_updated_or_added_after_given_date(
+                        table_id=CRIMES_TABLE_ID,
+                        socrata_domain=socrata_domain,
+                        update_col="updated_on",
+                        last_pull_date="1970-01-01T00:00:00.000",
+                        count_col="id",
+                        scheme="http",
+                        page_size=page_size,
+                    )
+                    pull_seconds.append(time.perf_counter() - start)
+                best_pull = min(pull_seconds)
+                benchmark_rows.append(
+                    {
+                        "latency_s": latency,
+                        "page_size": page_size,
+                        "rows": len(pulled_df),
+                        "count_query_s": min(count_seconds),
+                        "pull_s": best_pull,
+                        "rows_per_s": len(pulled_df) / best_pull,
+                    }
+                )
+        finally:
+            stop_socrata_standin(server=server)
+    return pd.DataFrame(benchmark_rows)
+
+
+def check_incremental_pull_correctness(
+    n_records: int, n_new: int, n_updated: int, page_size: int
+) -> Dict:
+    state = make_socrata_standin_state(n_crimes=n_records, n_violence=0)
+    server, socrata_domain = start_socrata_standin(state=state)
+    try:
+        local_df = pull_full_crimes_table(socrata_domain=socrata_domain, page_size=page_size)
+        new_ids, updated_ids = apply_upstream_changes(
+            state=state, table_id=CRIMES_TABLE_ID, n_new=n_new, n_updated=n_updated
+        )
+        start = time.perf_counter()
+        recent_df = get_chicago_crimes_data_since_latest_record(
+            crimes_gdf=local_df, socrata_domain=socrata_domain, scheme="http", page_size=page_size
+        )
+        pull_seconds = time.perf_counter() - start
+        upstream_df = pull_full_crimes_table(socrata_domain=socrata_domain, page_size=page_size)
+    finally:
+        stop_socrata_standin(server=server)
+
+    refreshed_parts = [local_df.loc[~local_df["id"].isin(recent_df["id"])]]
+    if len(recent_df) > 0:
+        refreshed_parts.append(recent_df)
+    refreshed_df = pd.concat(refreshed_parts, ignore_index=True)
+    refreshed_df = refreshed_df.sort_values(by="id").reset_index(drop=True)
+    upstream_df = upstream_df.sort_values(by="id").reset_index(drop=True)
+    expected_ids = set(new_ids) | set(updated_ids)
+    pulled_ids = set(recent_df["id"])
+    same_ids = refreshed_df["id"].equals(upstream_df["id"])
+    correctness = {
+        "n_new": n_new,
+        "n_updated": n_updated,
+        "page_size": page_size,
+        "rows_pulled": len(recent_df),
+        "missing_ids": len(expected_ids - pulled_ids),
+        "unexpected_ids": len(pulled_ids - expected_ids),
+        "duplicate_ids": int(recent_df["id"].duplicated().sum()),
+        "matches_upstream": same_ids and refreshed_df.equals(upstream_df[refreshed_df.columns]),
+        "pull_s": pull_seconds,
+    }
+    return correctness
+
+
+def check_failure_handling(n_records: int = 2500, page_size: int = 1000) -> pd.DataFrame:
+    state = make_socrata_standin_state(n_crimes=n_records, n_violence=0)
+    server, socrata_domain = start_socrata_standin(state=state)
+    failure_rows = []
+    try:
+        # request 1 is the count query, the rest are pages
+        for failed_request in [1, 2, 3]:
+            with state["lock"]:
+                state["request_count"] = 0
+                state["fail_requests"] = {failed_request}
+            raised = None
+            try:
+                pull_full_crimes_table(socrata_domain=socrata_domain, page_size=page_size)
+            except requests.HTTPError as err:
+                raised = f"{type(err).__name__}: {err.response.status_code}"
+            failure_rows.append({"failed_request": failed_request, "raised": raised})
+    finally:
+        stop_socrata_standin(server=server)
+    return pd.DataFrame(failure_rows)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Socrata fetch path against a local stand-in portal."
+    )
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--latencies", type=float, nargs="+", default=[0.0, 0.05])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print("Throughput of a full pull through the incremental path")
+    throughput_df = benchmark_fetch_throughput(
+        n_records=args.rows,
+        page_sizes=args.page_sizes,
+        latencies=args.latencies,
+        n_repeats=args.repeats,
+    )
+    print(throughput_df.to_string(index=False))
+
+    print("\nCorrectness of incremental pulls")
+    correctness_df = pd.DataFrame(
+        [
+            check_incremental_pull_correctness(
+                n_records=args.rows, n_new=n_new, n_updated=n_updated, page_size=1000
+            )
+            for n_new, n_updated in [(0, 0), (150, 50), (600, 400), (1500, 1000)]
+        ]
+    )
+    print(correctness_df.to_string(index=False))
+
+    print("\nInjected failures")
+    print(check_failure_handling().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
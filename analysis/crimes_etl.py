@@ -1,9 +1,11 @@
 import os
+from typing import Union
 
 import pandas as pd
 import geopandas as gpd
 
 from utils import (
+    CLEAN_STORE_ROW_GROUP_SIZE,
     get_project_root_dir,
     extract_file_from_url,
     make_point_geometry,
@@ -19,6 +21,11 @@ from utils import (
     typeset_datetime_column,
     typeset_ordered_categorical_feature,
     standardize_mistakenly_int_parsed_categorical_series,
+    add_ids_to_id_index,
+    record_fresh_pull_in_snapshot_store,
+    read_parquet_without_geometry,
+    compact_dataframe,
+    get_socrata_table_records_updated_or_added_after_given_date,
 )
 
 
@@ -81,20 +88,55 @@ def transform_chicago_crimes_data(crimes_df: pd.DataFrame) -> gpd.GeoDataFrame:
     return crimes_gdf
 
 
+def compact_chicago_crimes_data(
+    crimes_gdf: gpd.GeoDataFrame, report_memory_usage: bool = True
+) -> pd.DataFrame:
+    crimes_df = compact_dataframe(
+        df=crimes_gdf,
+        string_columns=["case_number"],
+        dictionary_columns=["block"],
+        boolean_columns=["arrest", "domestic"],
+        report_memory_usage=report_memory_usage,
+    )
+    return crimes_df
+
+
 def load_clean_chicago_crimes_data(
     root_dir: os.path = get_project_root_dir(),
     force_repull: bool = False,
     force_remake: bool = False,
-) -> gpd.GeoDataFrame:
+    compact: bool = False,
+) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
     file_name = "Crimes_-_2001_to_present"
     clean_file_path = os.path.join(root_dir, "data_clean", f"{file_name}.parquet.gzip")
     if not os.path.isfile(clean_file_path) or force_remake:
         crimes_gdf = transform_chicago_crimes_data(
             crimes_df=load_raw_chicago_crimes_data(root_dir=root_dir, force_repull=force_repull)
         )
-        crimes_gdf.to_parquet(clean_file_path, compression="gzip")
+        crimes_gdf.to_parquet(
+            clean_file_path, compression="gzip", row_group_size=CLEAN_STORE_ROW_GROUP_SIZE
+        )
+        add_ids_to_id_index(
+            ids=crimes_gdf["id"], file_name=file_name, dataset_dir="", root_dir=root_dir
+        )
+        if force_remake or force_repull:
+            # keeps load_snapshot_as_of in step with the rewritten clean store
+            record_fresh_pull_in_snapshot_store(
+                fresh_df=crimes_gdf,
+                id_col="id",
+                update_col="updated_on",
+                file_name=file_name,
+                dataset_dir="",
+                root_dir=root_dir,
+            )
+    elif compact:
+        # without the geometry column, so no shapely object is built only to be dropped
+        print("Loading without the geometry column; it isn't counted in the usage below")
+        crimes_gdf = read_parquet_without_geometry(file_path=clean_file_path)
     else:
         crimes_gdf = gpd.read_parquet(clean_file_path)
+    if compact:
+        return compact_chicago_crimes_data(crimes_gdf=crimes_gdf)
     return crimes_gdf
 
 
@@ -104,28 +146,19 @@ def get_chicago_crimes_data_since_latest_record(
     filter_col: str = "updated_on",
     socrata_domain: str = "data.cityofchicago.org",
     count_col: str = "id",
+    scheme: str = "https",
+    page_size: int = 1000,
 ) -> pd.DataFrame:
-    api_call_base = f"https://{socrata_domain}/resource/{table_id}.csv"
     latest_update = crimes_gdf[filter_col].max()
-    latest_update_str = latest_update.strftime(format="%Y-%m-%dT%H:%M:%S.000")
-    filter_str = f"$where={filter_col}>'{latest_update_str}'"
-
-    result_count = get_number_of_results_for_socrata_query(
-        filter_str=filter_str, api_call_base=api_call_base, count_col=count_col
+    recent_crimes_df = get_socrata_table_records_updated_or_added_after_given_date(
+        table_id=table_id,
+        socrata_domain=socrata_domain,
+        update_col=filter_col,
+        last_pull_date=latest_update.strftime(format="%Y-%m-%dT%H:%M:%S.000"),
+        count_col=count_col,
+        scheme=scheme,
+        page_size=page_size,
     )
-
-    df_parts = []
-    for i in range((result_count // 1000) + 1):
-        offset = i * 1000
-        if result_count < (offset + 1000):
-            limit = result_count % 1000
-        else:
-            limit = 1000
-        pagination_str = f"$limit={limit}&$offset={offset}&$order={count_col}"
-        api_call = f"{api_call_base}?{filter_str}&{pagination_str}"
-        df_parts.append(make_api_call_for_socrata_csv_data(api_call))
-    recent_crimes_df = pd.concat(df_parts)
-    recent_crimes_df = recent_crimes_df.reset_index(drop=True)
     recent_crimes_df = transform_chicago_crimes_date_columns(
         crimes_df=recent_crimes_df, dt_format="%Y-%m-%dT%H:%M:%S.000"
     )
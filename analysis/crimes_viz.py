@@ -3,9 +3,12 @@ from typing import Dict, List, Union, Optional, Tuple
 
 import geopandas as gpd
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from pandas.api.types import CategoricalDtype
 import seaborn as sns
 
+from plot_cache import memoize_plot_aggregate
 from utils import read_raw_chicago_police_beats_geodata, get_project_root_dir
 
 
@@ -29,6 +32,51 @@ def validate_crime_col(crime_col: str, crime_descr: str, crime_df: pd.DataFrame)
     return ValueError
 
 
+@memoize_plot_aggregate(columns=["date", "arrest"], column_args=["crime_col"])
+def get_arrest_counts_for_periods(
+    crime_df: pd.DataFrame,
+    crime_descrs: List[str],
+    crime_col: str = "description",
+    frequencies: Optional[List[str]] = None,
+    start_date: str = "2005-01-01",
+    end_date: str = "today",
+) -> pd.DataFrame:
+    if frequencies is None:
+        frequencies = ["year", "month"]
+    date_mask = (crime_df["date"] >= start_date) & (crime_df["date"] <= end_date)
+    df = crime_df.loc[
+        date_mask & crime_df[crime_col].isin(crime_descrs), ["date", crime_col, "arrest"]
+    ]
+
+    # the one pass over the records is this daily groupby; every frequency rolls up from it
+    daily_df = (
+        df.groupby([df[crime_col].astype(str).rename("crime_descr"), df["date"].dt.normalize()])
+        .agg(cases=("arrest", "size"), arrests=("arrest", "sum"))
+        .reset_index()
+    )
+    period_parts = []
+    for frequency in frequencies:
+        freq = freq_selector(frequency)
+        period_ends = daily_df["date"].dt.to_period(freq).dt.to_timestamp(how="end").dt.normalize()
+        period_df = daily_df.groupby(["crime_descr", period_ends])[["cases", "arrests"]].sum()
+        period_df = period_df.unstack(level=0, fill_value=0)
+        if len(period_df) > 0:
+            period_df = period_df.reindex(
+                pd.date_range(period_df.index.min(), period_df.index.max(), freq=freq),
+                fill_value=0,
+            )
+        period_df = period_df.rename_axis("date").stack().reset_index()
+        period_df.insert(0, "frequency", frequency.lower())
+        period_parts.append(period_df)
+    counts_df = pd.concat(period_parts, ignore_index=True)
+    counts_df = counts_df[["frequency", "crime_descr", "date", "cases", "arrests"]]
+    counts_df[["cases", "arrests"]] = counts_df[["cases", "arrests"]].astype("int64")
+    counts_df["arrest_rate"] = counts_df["arrests"] / counts_df["cases"].where(
+        counts_df["cases"] > 0
+    )
+    return counts_df
+
+
 def make_plot_of_arrest_rate_per_period(
     crime_descr: str,
     crime_df: pd.DataFrame,
@@ -39,33 +87,36 @@ def make_plot_of_arrest_rate_per_period(
     arrest: bool = True,
     figsize: Tuple = (14, 6),
     more_crime_descr: str = "",
+    arrest_counts_df: Optional[pd.DataFrame] = None,
 ) -> None:
     label_descr = crime_descr.title()
 
-    crime_col = validate_crime_col(crime_col=crime_col, crime_descr=crime_descr, crime_df=crime_df)
-    if isinstance(crime_descr, list):
-        df = crime_df.loc[
-            (crime_df[crime_col].isin(crime_descr))
-            & (crime_df["date"] >= start_date)
-            & (crime_df["date"] <= end_date)
-        ].copy()
-    else:
-        df = crime_df.loc[
-            (crime_df[crime_col] == crime_descr)
-            & (crime_df["date"] >= start_date)
-            & (crime_df["date"] <= end_date)
-        ].copy()
+    crime_descrs = crime_descr if isinstance(crime_descr, list) else [crime_descr]
+    if arrest_counts_df is None:
+        crime_col = validate_crime_col(
+            crime_col=crime_col, crime_descr=crime_descrs[0], crime_df=crime_df
+        )
+        arrest_counts_df = get_arrest_counts_for_periods(
+            crime_df=crime_df,
+            crime_descrs=crime_descrs,
+            crime_col=crime_col,
+            frequencies=[frequency],
+            start_date=start_date,
+            end_date=end_date,
+        )
+    period_counts_df = (
+        arrest_counts_df.loc[
+            (arrest_counts_df["frequency"] == frequency.lower())
+            & (arrest_counts_df["crime_descr"].isin(crime_descrs))
+        ]
+        .groupby("date")[["cases", "arrests"]]
+        .sum()
+    )
+    count_df = period_counts_df["cases"]
+    arr_count_df = period_counts_df["arrests"]
 
     fig, ax = plt.subplots(sharex=True, figsize=figsize)
-    count_df = df.groupby([pd.Grouper(key="date", freq=freq_selector(frequency))]).count()[
-        "case_number"
-    ]
     count_df.plot(ax=ax, kind="line", legend=None, label=f"{label_descr} Cases", color="#0570b0")
-    arr_count_df = (
-        df.loc[df["arrest"] == True]
-        .groupby([pd.Grouper(key="date", freq=freq_selector(frequency))])
-        .count()["case_number"]
-    )
     arr_count_df.plot(
         ax=ax,
         kind="line",
@@ -85,20 +136,14 @@ def make_plot_of_arrest_rate_per_period(
     ax.legend()
 
 
-def make_choropleth_of_crime_counts_per_beat(
+@memoize_plot_aggregate(columns=["date", "beat", "description", "primary_type"])
+def get_crime_counts_per_beat(
     df: pd.DataFrame,
-    beats_gdf: gpd.GeoDataFrame,
     crime_descr: str = "HOMICIDE",
     crime_col="primary_type",
     start_date: str = "2001-01-01",
-    more_crime_descr: str = "",
     end_date: str = "2022-03-15",
-    figsize: Tuple = (10, 10),
-    my_cmap: str = "YlGn",
-    scale: float = 0.6,
-    tight: bool = True,
-    title_fs: Optional = None,
-) -> None:
+) -> pd.DataFrame:
     crime_col = validate_crime_col(crime_col=crime_col, crime_descr=crime_descr, crime_df=df)
     df = df.loc[
         (df["date"] >= start_date)
@@ -113,10 +158,35 @@ def make_choropleth_of_crime_counts_per_beat(
         .reset_index()
     )
     count_df.rename({0: "Count"}, axis=1, inplace=True)
+    count_df = count_df.loc[count_df[crime_col] == crime_descr.upper()]
+    return count_df
+
+
+def make_choropleth_of_crime_counts_per_beat(
+    df: pd.DataFrame,
+    beats_gdf: gpd.GeoDataFrame,
+    crime_descr: str = "HOMICIDE",
+    crime_col="primary_type",
+    start_date: str = "2001-01-01",
+    more_crime_descr: str = "",
+    end_date: str = "2022-03-15",
+    figsize: Tuple = (10, 10),
+    my_cmap: str = "YlGn",
+    scale: float = 0.6,
+    tight: bool = True,
+    title_fs: Optional = None,
+) -> None:
+    count_df = get_crime_counts_per_beat(
+        df=df,
+        crime_descr=crime_descr,
+        crime_col=crime_col,
+        start_date=start_date,
+        end_date=end_date,
+    )
 
     map_df = pd.merge(
         left=beats_gdf,
-        right=count_df.loc[count_df[crime_col] == crime_descr.upper()],
+        right=count_df,
         right_on="beat",
         left_on="beat_num",
         how="left",
@@ -149,6 +219,95 @@ def make_choropleth_of_crime_counts_per_beat(
         plt.tight_layout()
 
 
+@memoize_plot_aggregate(
+    columns=["date", "id", "description", "primary_type"], column_args=["x_ax", "y_ax"]
+)
+def get_crime_frequency_counts_for_heatmap(
+    df: pd.DataFrame,
+    crime_descr: str,
+    crime_col: str = "primary_type",
+    x_ax: str = "month",
+    y_ax: str = "weekday",
+    start_date: str = "2001-01-01",
+    end_date: str = "today",
+) -> pd.DataFrame:
+    crime_col = validate_crime_col(crime_col=crime_col, crime_descr=crime_descr, crime_df=df)
+    tmp_df = df.loc[
+        (df["date"] >= start_date) & (df["date"] <= end_date) & (df[crime_col] == crime_descr)
+    ].copy()
+    tmp_counts = tmp_df.groupby([tmp_df[y_ax], tmp_df[x_ax]])["id"].count()
+    tmp_counts = tmp_counts.unstack(level=1, fill_value=0)
+    return tmp_counts
+
+
+def get_categorical_codes_and_labels(series: pd.Series) -> Tuple[np.ndarray, List]:
+    if not isinstance(series.dtype, CategoricalDtype):
+        series = series.astype("category")
+    return series.cat.codes.to_numpy(), list(series.cat.categories)
+
+
+@memoize_plot_aggregate(version=2, columns=["date"], column_args=["crime_col", "x_ax", "y_ax"])
+def get_crime_frequency_tensor(
+    df: pd.DataFrame,
+    crime_col: str = "primary_type",
+    x_ax: str = "hour",
+    y_ax: str = "weekday",
+    start_date: str = "2001-01-01",
+    end_date: str = "today",
+) -> Dict:
+    date_mask = ((df["date"] >= start_date) & (df["date"] <= end_date)).to_numpy()
+    crime_codes, crime_descrs = get_categorical_codes_and_labels(series=df[crime_col])
+    y_codes, y_labels = get_categorical_codes_and_labels(series=df[y_ax])
+    x_codes, x_labels = get_categorical_codes_and_labels(series=df[x_ax])
+    valid_mask = date_mask & (crime_codes >= 0) & (y_codes >= 0) & (x_codes >= 0)
+
+    shape = (len(crime_descrs), len(y_labels), len(x_labels))
+    flat_codes = np.ravel_multi_index(
+        (
+            crime_codes[valid_mask].astype("int64"),
+            y_codes[valid_mask].astype("int64"),
+            x_codes[valid_mask].astype("int64"),
+        ),
+        shape,
+    )
+    counts = np.bincount(flat_codes, minlength=np.prod(shape)).reshape(shape)
+    return {
+        "counts": counts,
+        "crime_col": crime_col,
+        "crime_descrs": crime_descrs,
+        "start_date": start_date,
+        "end_date": end_date,
+        "y_ax": y_ax,
+        "y_labels": y_labels,
+        "x_ax": x_ax,
+        "x_labels": x_labels,
+    }
+
+
+def get_heatmap_counts_from_tensor(frequency_tensor: Dict, crime_descr: str) -> pd.DataFrame:
+    if crime_descr not in frequency_tensor["crime_descrs"]:
+        raise ValueError(
+            f"'{crime_descr}' isn't a {frequency_tensor['crime_col']} value in the frequency tensor"
+        )
+    crime_idx = frequency_tensor["crime_descrs"].index(crime_descr)
+    tmp_counts = pd.DataFrame(
+        frequency_tensor["counts"][crime_idx],
+        index=pd.CategoricalIndex(
+            frequency_tensor["y_labels"],
+            categories=frequency_tensor["y_labels"],
+            ordered=True,
+            name=frequency_tensor["y_ax"],
+        ),
+        columns=pd.CategoricalIndex(
+            frequency_tensor["x_labels"],
+            categories=frequency_tensor["x_labels"],
+            ordered=True,
+            name=frequency_tensor["x_ax"],
+        ),
+    )
+    return tmp_counts
+
+
 def make_heatmap_of_crime_frequency(
     df: pd.DataFrame,
     crime_descr: str,
@@ -161,19 +320,38 @@ def make_heatmap_of_crime_frequency(
     cmap: str = "YlGn",
     fig_width: float = 14,
     force_tall_xy: bool = False,
+    frequency_tensor: Optional[Dict] = None,
 ) -> None:
-    crime_col = validate_crime_col(crime_col=crime_col, crime_descr=crime_descr, crime_df=df)
-    if not force_tall_xy:
-        if df[x_ax].nunique() < df[y_ax].nunique():
-            temp_ax = x_ax
-            x_ax = y_ax
-            y_ax = temp_ax
+    if frequency_tensor is not None:
+        # the tensor was counted over its own window and crime column, so those are what
+        # the title has to report
+        crime_col = frequency_tensor["crime_col"]
+        start_date = frequency_tensor["start_date"]
+        end_date = frequency_tensor["end_date"]
+        x_ax = frequency_tensor["x_ax"]
+        y_ax = frequency_tensor["y_ax"]
+        tmp_counts = get_heatmap_counts_from_tensor(
+            frequency_tensor=frequency_tensor, crime_descr=crime_descr
+        )
+        if not force_tall_xy and tmp_counts.shape[1] < tmp_counts.shape[0]:
+            tmp_counts = tmp_counts.T
+            x_ax, y_ax = y_ax, x_ax
+    else:
+        if not force_tall_xy:
+            if df[x_ax].nunique() < df[y_ax].nunique():
+                temp_ax = x_ax
+                x_ax = y_ax
+                y_ax = temp_ax
 
-    tmp_df = df.loc[
-        (df["date"] >= start_date) & (df["date"] <= end_date) & (df[crime_col] == crime_descr)
-    ].copy()
-    tmp_counts = tmp_df.groupby([tmp_df[y_ax], tmp_df[x_ax]])["id"].count()
-    tmp_counts = tmp_counts.unstack(level=1, fill_value=0)
+        tmp_counts = get_crime_frequency_counts_for_heatmap(
+            df=df,
+            crime_descr=crime_descr,
+            crime_col=crime_col,
+            x_ax=x_ax,
+            y_ax=y_ax,
+            start_date=start_date,
+            end_date=end_date,
+        )
 
     aspect = tmp_counts.shape[1] / tmp_counts.shape[0]
     figsize = (fig_width, fig_width / aspect * 0.95)
@@ -221,6 +399,13 @@ def produce_visualizations(
         print(f"Number of {crime_descr} Cases by description since 2001")
         query = df.loc[(df["primary_type"] == crime_descr), "description"].value_counts()
         print(query[(query > qmin) & (query < qmax)])
+    arrest_counts_df = get_arrest_counts_for_periods(
+        crime_df=df,
+        crime_descrs=[crime_descr],
+        crime_col=crime_col,
+        frequencies=["year", "month"],
+        end_date=end_date,
+    )
     make_plot_of_arrest_rate_per_period(
         crime_descr=crime_descr,
         crime_df=df,
@@ -228,6 +413,7 @@ def produce_visualizations(
         frequency="year",
         end_date=end_date,
         more_crime_descr=more_crime_descr,
+        arrest_counts_df=arrest_counts_df,
     )
     make_plot_of_arrest_rate_per_period(
         crime_descr=crime_descr,
@@ -236,6 +422,7 @@ def produce_visualizations(
         frequency="month",
         end_date=end_date,
         more_crime_descr=more_crime_descr,
+        arrest_counts_df=arrest_counts_df,
     )
     more_crime_descr = more_crime_descr.upper()
     make_heatmap_of_crime_frequency(
@@ -0,0 +1,353 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utils import (
+    get_project_root_dir,
+    get_clean_store_file_path,
+    get_snapshot_dir,
+    get_snapshot_manifest,
+    restore_categorical_dtypes,
+    standardize_ids,
+)
+
+CRIMES_CLEAN_FILE_NAME = "Crimes_-_2001_to_present"
+CRIMES_DATASET_DIR = ""
+CRIMES_ID_COL = "id"
+VIOLENCE_CLEAN_FILE_NAME = "Violence_Reduction_-_Victims_of_Homicides_and_Non-Fatal_Shootings"
+VIOLENCE_DATASET_DIR = "homicides_and_shootings"
+VIOLENCE_ID_COL = "unique_id"
+
+
+def get_case_number_index_file_path(
+    file_name: str, dataset_dir: str, root_dir: os.path = get_project_root_dir()
+) -> os.path:
+    return os.path.join(root_dir, "data_clean", dataset_dir, f"{file_name}_case_number_index.npz")
+
+
+def standardize_case_numbers(case_numbers: pd.Series) -> np.ndarray:
+    case_numbers = case_numbers.fillna("").astype(str).str.strip()
+    return np.array(case_numbers.tolist(), dtype=str)
+
+
+def get_case_number_index_sources(
+    file_name: str, dataset_dir: str, root_dir: os.path = get_project_root_dir()
+) -> pd.DataFrame:
+    # the clean store, then the latest base snapshot, then the change logs written since it,
+    # so a record re-pulled into a later source supersedes its earlier row; the base keeps
+    # records that came in through refreshes once compaction folds their change logs away
+    dataset_path = os.path.join(root_dir, "data_clean", dataset_dir)
+    source_paths = []
+    clean_file_path = get_clean_store_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    if os.path.isfile(clean_file_path):
+        source_paths.append(clean_file_path)
+    snapshot_dir = get_snapshot_dir(file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir)
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    base_df = manifest_df.loc[manifest_df["part"] == "base"]
+    base_pulled_at = pd.Timestamp.min
+    if len(base_df) > 0:
+        base_pulled_at = base_df["pulled_at"].iloc[-1]
+        source_paths.append(os.path.join(snapshot_dir, base_df["file_name"].iloc[-1]))
+    changes_df = manifest_df.loc[
+        (manifest_df["part"] == "changes") & (manifest_df["pulled_at"] > base_pulled_at)
+    ]
+    for fn in changes_df["file_name"]:
+        source_paths.append(os.path.join(snapshot_dir, fn))
+    sources_df = pd.DataFrame(
+        {
+            "source": [os.path.relpath(fp, dataset_path) for fp in source_paths],
+            "num_rows": [pq.ParquetFile(fp).metadata.num_rows for fp in source_paths],
+            "mtime": [os.stat(fp).st_mtime_ns for fp in source_paths],
+        },
+        columns=["source", "num_rows", "mtime"],
+    )
+    return sources_df
+
+
+def make_empty_case_number_index() -> Dict:
+    return {
+        "case_numbers": np.array([], dtype=str),
+        "ids": np.array([], dtype="int64"),
+        "source_codes": np.array([], dtype="int32"),
+        "row_positions": np.array([], dtype="int64"),
+        "sources": np.array([], dtype=str),
+        "source_num_rows": np.array([], dtype="int64"),
+        "source_mtimes": np.array([], dtype="int64"),
+    }
+
+
+def read_case_number_index_entries(
+    source_file_path: os.path, source_code: int, id_col: str
+) -> pd.DataFrame:
+    source_df = pq.read_table(source_file_path, columns=["case_number", id_col]).to_pandas()
+    entries_df = pd.DataFrame(
+        {
+            "case_numbers": standardize_case_numbers(case_numbers=source_df["case_number"]),
+            "ids": standardize_ids(ids=source_df[id_col]),
+            "source_codes": np.full(len(source_df), source_code, dtype="int32"),
+            "row_positions": np.arange(len(source_df), dtype="int64"),
+        }
+    )
+    return entries_df
+
+
+def update_case_number_index(
+    case_number_index: Dict, sources_df: pd.DataFrame, dataset_path: os.path, id_col: str
+) -> Dict:
+    first_source_code = len(case_number_index["sources"])
+    entry_parts = [
+        pd.DataFrame(
+            {
+                col: case_number_index[col]
+                for col in ["case_numbers", "ids", "source_codes", "row_positions"]
+            }
+        )
+    ]
+    for source_code, source in enumerate(sources_df["source"], start=first_source_code):
+        entry_parts.append(
+            read_case_number_index_entries(
+                source_file_path=os.path.join(dataset_path, source),
+                source_code=source_code,
+                id_col=id_col,
+            )
+        )
+    # the empty starting frame is left out when there are others, so its int64 ids don't
+    # clash with string ids
+    entries_df = pd.concat(
+        [part for part in entry_parts if len(part) > 0] or entry_parts[:1], ignore_index=True
+    )
+    # entries are in source order, so keeping the last row per id keeps its latest version;
+    # blank case numbers are dropped only after that, so they still supersede older rows
+    entries_df = entries_df.drop_duplicates(subset="ids", keep="last")
+    entries_df = entries_df.loc[entries_df["case_numbers"] != ""]
+    case_numbers = standardize_case_numbers(case_numbers=entries_df["case_numbers"])
+    # stable, so rows sharing a case_number stay in source and row order
+    sort_order = np.argsort(case_numbers, kind="stable")
+    case_number_index = {
+        "case_numbers": case_numbers[sort_order],
+        "ids": standardize_ids(ids=entries_df["ids"]).take(sort_order),
+        "source_codes": entries_df["source_codes"].to_numpy(dtype="int32")[sort_order],
+        "row_positions": entries_df["row_positions"].to_numpy(dtype="int64")[sort_order],
+        "sources": np.concatenate(
+            [case_number_index["sources"], sources_df["source"].to_numpy(dtype=str)]
+        ),
+        "source_num_rows": np.concatenate(
+            [case_number_index["source_num_rows"], sources_df["num_rows"].to_numpy("int64")]
+        ),
+        "source_mtimes": np.concatenate(
+            [case_number_index["source_mtimes"], sources_df["mtime"].to_numpy("int64")]
+        ),
+    }
+    return case_number_index
+
+
+def save_case_number_index(case_number_index: Dict, index_file_path: os.path) -> None:
+    os.makedirs(os.path.dirname(index_file_path), exist_ok=True)
+    # write then swap, so a reader never sees a half-written index
+    tmp_file_path = f"{index_file_path}.tmp.npz"
+    np.savez(tmp_file_path, **case_number_index)
+    os.replace(tmp_file_path, index_file_path)
+
+
+def get_new_case_number_index_sources(
+    case_number_index: Dict, sources_df: pd.DataFrame
+) -> Optional[pd.DataFrame]:
+    # None unless the sources the index was built from are still the leading sources, each
+    # unchanged; a remade clean store, a new base or a compacted change log moves row
+    # positions or source precedence, so the index has to be rebuilt
+    indexed_sources = list(
+        zip(
+            case_number_index["sources"],
+            case_number_index["source_num_rows"],
+            case_number_index["source_mtimes"],
+        )
+    )
+    leading_sources_df = sources_df.iloc[: len(indexed_sources)]
+    if list(leading_sources_df.itertuples(index=False, name=None)) != indexed_sources:
+        return None
+    new_sources_df = sources_df.iloc[len(indexed_sources) :]
+    return new_sources_df.reset_index(drop=True)
+
+
+def load_case_number_index(
+    file_name: str,
+    dataset_dir: str,
+    id_col: str,
+    root_dir: os.path = get_project_root_dir(),
+    force_remake: bool = False,
+) -> Dict:
+    index_file_path = get_case_number_index_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    sources_df = get_case_number_index_sources(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    new_sources_df = None
+    if os.path.isfile(index_file_path) and not force_remake:
+        with np.load(index_file_path) as npz_file:
+            case_number_index = {key: npz_file[key] for key in npz_file.files}
+        new_sources_df = get_new_case_number_index_sources(
+            case_number_index=case_number_index, sources_df=sources_df
+        )
+        if new_sources_df is not None and len(new_sources_df) == 0:
+            return case_number_index
+    if new_sources_df is None:
+        case_number_index = make_empty_case_number_index()
+        new_sources_df = sources_df
+    case_number_index = update_case_number_index(
+        case_number_index=case_number_index,
+        sources_df=new_sources_df,
+        dataset_path=os.path.join(root_dir, "data_clean", dataset_dir),
+        id_col=id_col,
+    )
+    save_case_number_index(case_number_index=case_number_index, index_file_path=index_file_path)
+    return case_number_index
+
+
+def update_persisted_case_number_index(
+    file_name: str, dataset_dir: str, id_col: str, root_dir: os.path = get_project_root_dir()
+) -> Dict:
+    # loading folds any change logs written since the last save into the index
+    return load_case_number_index(
+        file_name=file_name, dataset_dir=dataset_dir, id_col=id_col, root_dir=root_dir
+    )
+
+
+def lookup_case_number_positions(
+    case_number_index: Dict, case_numbers: pd.Series, first_match_only: bool = False
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    index_keys = case_number_index["case_numbers"]
+    query_keys = standardize_case_numbers(case_numbers=case_numbers)
+    lower = np.searchsorted(index_keys, query_keys, side="left")
+    upper = np.searchsorted(index_keys, query_keys, side="right")
+    match_counts = upper - lower
+    match_counts[query_keys == ""] = 0
+    if first_match_only:
+        match_counts = np.minimum(match_counts, 1)
+    query_positions = np.repeat(np.arange(len(query_keys), dtype="int64"), match_counts)
+    run_starts = np.repeat(np.cumsum(match_counts) - match_counts, match_counts)
+    index_positions = np.repeat(lower, match_counts) + (
+        np.arange(len(query_positions), dtype="int64") - run_starts
+    )
+    source_codes = case_number_index["source_codes"][index_positions]
+    row_positions = case_number_index["row_positions"][index_positions]
+    return query_positions, source_codes, row_positions
+
+
+def gather_store_rows(
+    store_file_path: os.path, row_positions: np.ndarray, columns: List[str]
+) -> pd.DataFrame:
+    parquet_file = pq.ParquetFile(store_file_path)
+    if len(row_positions) == 0:
+        return parquet_file.schema_arrow.empty_table().select(columns).to_pandas()
+    group_sizes = np.array(
+        [
+            parquet_file.metadata.row_group(i).num_rows
+            for i in range(parquet_file.metadata.num_row_groups)
+        ],
+        dtype="int64",
+    )
+    group_starts = np.cumsum(group_sizes) - group_sizes
+    row_groups = np.searchsorted(group_starts, row_positions, side="right") - 1
+    needed_groups = np.unique(row_groups)
+    # only the row groups holding a matched row are read and decompressed
+    store_table = parquet_file.read_row_groups(needed_groups.tolist(), columns=columns)
+    read_group_starts = np.cumsum(group_sizes[needed_groups]) - group_sizes[needed_groups]
+    table_positions = (
+        row_positions
+        - group_starts[row_groups]
+        + read_group_starts[np.searchsorted(needed_groups, row_groups)]
+    )
+    gathered_df = store_table.take(table_positions).to_pandas().reset_index(drop=True)
+    return gathered_df
+
+
+def enrich_records_by_case_number(
+    df: pd.DataFrame,
+    case_number_index: Dict,
+    dataset_path: os.path,
+    columns: List[str],
+    suffix: str,
+    key_col: str = "case_number",
+    first_match_only: bool = False,
+) -> pd.DataFrame:
+    query_positions, source_codes, row_positions = lookup_case_number_positions(
+        case_number_index=case_number_index,
+        case_numbers=df[key_col],
+        first_match_only=first_match_only,
+    )
+    columns = [col for col in columns if col != key_col]
+    gathered_parts = []
+    for source_code in np.unique(source_codes):
+        source_mask = source_codes == source_code
+        gathered_part = gather_store_rows(
+            store_file_path=os.path.join(dataset_path, case_number_index["sources"][source_code]),
+            row_positions=row_positions[source_mask],
+            columns=columns,
+        )
+        gathered_part.index = query_positions[source_mask]
+        gathered_parts.append(gathered_part)
+    if len(gathered_parts) == 0:
+        gathered_df = pd.DataFrame(columns=columns)
+    else:
+        gathered_df = pd.concat(gathered_parts).sort_index(kind="stable")
+        gathered_df = restore_categorical_dtypes(df=gathered_df, reference_df=gathered_parts[0])
+    gathered_df.columns = [
+        f"{col}{suffix}" if col in df.columns else col for col in gathered_df.columns
+    ]
+    enriched_df = df.reset_index(drop=True).join(gathered_df, how="left")
+    enriched_df = enriched_df.reset_index(drop=True)
+    return enriched_df
+
+
+def enrich_violence_victims_with_crime_attributes(
+    violence_df: pd.DataFrame,
+    crime_columns: List[str],
+    root_dir: os.path = get_project_root_dir(),
+    case_number_index: Optional[Dict] = None,
+) -> pd.DataFrame:
+    if case_number_index is None:
+        case_number_index = load_case_number_index(
+            file_name=CRIMES_CLEAN_FILE_NAME,
+            dataset_dir=CRIMES_DATASET_DIR,
+            id_col=CRIMES_ID_COL,
+            root_dir=root_dir,
+        )
+    enriched_df = enrich_records_by_case_number(
+        df=violence_df,
+        case_number_index=case_number_index,
+        dataset_path=os.path.join(root_dir, "data_clean", CRIMES_DATASET_DIR),
+        columns=crime_columns,
+        suffix="_crime",
+        first_match_only=True,
+    )
+    return enriched_df
+
+
+def enrich_crimes_with_violence_victim_attributes(
+    crimes_df: pd.DataFrame,
+    violence_columns: List[str],
+    root_dir: os.path = get_project_root_dir(),
+    case_number_index: Optional[Dict] = None,
+) -> pd.DataFrame:
+    if case_number_index is None:
+        case_number_index = load_case_number_index(
+            file_name=VIOLENCE_CLEAN_FILE_NAME,
+            dataset_dir=VIOLENCE_DATASET_DIR,
+            id_col=VIOLENCE_ID_COL,
+            root_dir=root_dir,
+        )
+    enriched_df = enrich_records_by_case_number(
+        df=crimes_df,
+        case_number_index=case_number_index,
+        dataset_path=os.path.join(root_dir, "data_clean", VIOLENCE_DATASET_DIR),
+        columns=violence_columns,
+        suffix="_victim",
+        first_match_only=False,
+    )
+    return enriched_df
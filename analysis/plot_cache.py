@@ -0,0 +1,194 @@
+from collections import OrderedDict
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils import get_project_root_dir
+
+PLOT_CACHE_DIR = os.path.join(get_project_root_dir(), "output", "plot_cache")
+_memory_caches: Dict[str, OrderedDict] = {}
+_memory_cache_lock = threading.Lock()
+_fingerprint_cache: Dict[int, Dict] = {}
+_fingerprint_cache_lock = threading.Lock()
+
+
+def hash_series(series: pd.Series) -> str:
+    row_hashes = pd.util.hash_pandas_object(series, index=False)
+    return hashlib.sha1(row_hashes.to_numpy().tobytes()).hexdigest()
+
+
+def get_column_hash(df: pd.DataFrame, col: str) -> str:
+    # a column is hashed in full once per frame; after that each call only re-hashes a fixed
+    # sample of its rows, and redoes the full hash when the sample has moved (a replaced or
+    # recoded column). A single cell edited in place can slip past the sample, so call
+    # clear_plot_cache() after one
+    sample_positions = np.linspace(0, len(df) - 1, min(len(df), 4096)).astype("int64")
+    sample_hash = hash_series(series=df[col].iloc[sample_positions])
+    with _fingerprint_cache_lock:
+        frame_entry = _fingerprint_cache.get(id(df))
+        if frame_entry is None or frame_entry["ref"]() is not df:
+            frame_key = id(df)
+
+            def forget_frame(frame_ref: weakref.ref) -> None:
+                with _fingerprint_cache_lock:
+                    if _fingerprint_cache.get(frame_key, {}).get("ref") is frame_ref:
+                        del _fingerprint_cache[frame_key]
+
+            frame_entry = {"ref": weakref.ref(df, forget_frame), "column_hashes": {}}
+            _fingerprint_cache[frame_key] = frame_entry
+        column_hashes = frame_entry["column_hashes"]
+        if (col, sample_hash) in column_hashes:
+            return column_hashes[(col, sample_hash)]
+    column_hash = hash_series(series=df[col])
+    with _fingerprint_cache_lock:
+        for stale_key in [key for key in column_hashes if key[0] == col]:
+            del column_hashes[stale_key]
+        column_hashes[(col, sample_hash)] = column_hash
+    return column_hash
+
+
+def fingerprint_dataset(df: pd.DataFrame, columns: Optional[List[str]] = None) -> str:
+    # shape, dtypes and numeric reductions over the id and date columns are recomputed on
+    # every call, since any added, dropped or re-pulled record moves at least one of them;
+    # string ids and the columns the aggregate reads go through the per-frame column hashes
+    fingerprint_parts = [str(df.shape), str(list(df.columns)), str(list(df.dtypes.astype(str)))]
+    hashed_columns = set(col for col in columns or [] if col in df.columns)
+    for col in ["id", "unique_id", "date", "updated_on", "updated"]:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dropna().astype("int64")
+        elif not pd.api.types.is_numeric_dtype(series):
+            hashed_columns.add(col)
+            continue
+        fingerprint_parts.append(f"{col}:{series.min()}:{series.max()}:{series.sum()}")
+    for col in sorted(hashed_columns):
+        fingerprint_parts.append(f"{col}:{get_column_hash(df=df, col=col)}")
+    return hashlib.sha1("|".join(fingerprint_parts).encode("utf-8")).hexdigest()
+
+
+def copy_plot_aggregate(result: object) -> object:
+    # so styling code that tweaks a returned aggregate can't corrupt the cached one
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return result.copy()
+    if isinstance(result, dict):
+        return {key: copy_plot_aggregate(result=value) for key, value in result.items()}
+    if isinstance(result, (tuple, list)):
+        return type(result)(copy_plot_aggregate(result=part) for part in result)
+    return result
+
+
+def make_plot_aggregate_key(
+    func_name: str, version: int, arguments: Dict, read_columns: List[str]
+) -> str:
+    key_parts = [func_name, f"version={version}"]
+    for arg_name in sorted(arguments.keys()):
+        arg_value = arguments[arg_name]
+        if isinstance(arg_value, pd.DataFrame):
+            arg_value = f"dataset:{fingerprint_dataset(df=arg_value, columns=read_columns)}"
+        key_parts.append(f"{arg_name}={arg_value!r}")
+    return hashlib.sha1("|".join(key_parts).encode("utf-8")).hexdigest()
+
+
+def prune_plot_cache_dir(cache_dir: os.path, file_prefix: str, max_entries: int) -> None:
+    # least recently used first, since a disk hit touches its file
+    cache_files = [
+        os.path.join(cache_dir, fn)
+        for fn in os.listdir(cache_dir)
+        # sha1 hex key plus ".pkl", so one function's prefix can't match another's files
+        if fn.startswith(file_prefix) and fn.endswith(".pkl") and len(fn) == len(file_prefix) + 44
+    ]
+    cache_files.sort(key=os.path.getmtime)
+    for cache_file_path in cache_files[: max(len(cache_files) - max_entries, 0)]:
+        try:
+            os.remove(cache_file_path)
+        except FileNotFoundError:
+            pass
+
+
+def clear_plot_cache(
+    cache_dir: Optional[os.path] = PLOT_CACHE_DIR, clear_disk: bool = False
+) -> None:
+    with _memory_cache_lock:
+        for memory_cache in _memory_caches.values():
+            memory_cache.clear()
+    with _fingerprint_cache_lock:
+        _fingerprint_cache.clear()
+    if clear_disk and os.path.isdir(cache_dir):
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith(".pkl"):
+                os.remove(os.path.join(cache_dir, file_name))
+
+
+def memoize_plot_aggregate(
+    version: int = 1,
+    columns: Optional[List[str]] = None,
+    column_args: Optional[List[str]] = None,
+    max_entries: int = 32,
+    max_disk_entries: int = 128,
+    cache_dir: Optional[os.path] = PLOT_CACHE_DIR,
+) -> Callable:
+    # bump version whenever the aggregate's code changes, so results pickled by the old
+    # code stop matching; columns (and the column names passed in column_args) are the
+    # dataset columns the aggregate reads
+    def decorator(aggregate_func: Callable) -> Callable:
+        memory_cache = _memory_caches.setdefault(aggregate_func.__qualname__, OrderedDict())
+        func_signature = inspect.signature(aggregate_func)
+        file_prefix = f"{aggregate_func.__name__}_"
+
+        @functools.wraps(aggregate_func)
+        def wrapper(*args, **kwargs):
+            bound_args = func_signature.bind(*args, **kwargs)
+            bound_args.apply_defaults()
+            read_columns = list(columns or []) + [
+                bound_args.arguments[arg_name] for arg_name in column_args or []
+            ]
+            key = make_plot_aggregate_key(
+                func_name=aggregate_func.__qualname__,
+                version=version,
+                arguments=bound_args.arguments,
+                read_columns=read_columns,
+            )
+            with _memory_cache_lock:
+                if key in memory_cache:
+                    memory_cache.move_to_end(key)
+                    return copy_plot_aggregate(result=memory_cache[key])
+
+            cache_file_path = None
+            if cache_dir is not None:
+                cache_file_path = os.path.join(cache_dir, f"{file_prefix}{key}.pkl")
+            if cache_file_path is not None and os.path.isfile(cache_file_path):
+                with open(cache_file_path, "rb") as cache_file:
+                    result = pickle.load(cache_file)
+                os.utime(cache_file_path)
+            else:
+                result = aggregate_func(*args, **kwargs)
+                if cache_file_path is not None:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    tmp_file_path = f"{cache_file_path}.{os.getpid()}.tmp"
+                    with open(tmp_file_path, "wb") as cache_file:
+                        pickle.dump(result, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp_file_path, cache_file_path)
+                    prune_plot_cache_dir(
+                        cache_dir=cache_dir, file_prefix=file_prefix, max_entries=max_disk_entries
+                    )
+
+            with _memory_cache_lock:
+                memory_cache[key] = result
+                memory_cache.move_to_end(key)
+                while len(memory_cache) > max_entries:
+                    memory_cache.popitem(last=False)
+            return copy_plot_aggregate(result=result)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,453 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import geopandas as gpd
+import pandas as pd
+
+from crimes_etl import get_chicago_crimes_data_since_latest_record, transform_chicago_crimes_data
+from time_series import (
+    get_daily_counts_file_path,
+    load_daily_counts,
+    update_daily_counts,
+    save_daily_counts,
+)
+from utils import (
+    get_project_root_dir,
+    get_clean_store_file_path,
+    get_snapshot_dir,
+    get_snapshot_manifest,
+    load_snapshot_as_of,
+    get_number_of_results_for_socrata_query,
+    get_socrata_table_records_updated_or_added_after_given_date,
+    read_raw_chicago_police_beats_geodata,
+    split_new_and_updated_records_and_save_them_to_file,
+)
+from violence_etl import (
+    transform_homicide_and_nfs_data,
+    split_new_and_updated_homicide_and_shooting_records_and_save_them_to_file,
+)
+
+CRIMES_FILE_NAME = "Crimes_-_2001_to_present"
+VIOLENCE_FILE_NAME = "Violence_Reduction_-_Victims_of_Homicides_and_Non-Fatal_Shootings"
+VIOLENCE_DATASET_DIR = "homicides_and_shootings"
+
+
+def get_latest_local_update(
+    file_name: str, dataset_dir: str, update_col: str, root_dir: os.path = get_project_root_dir()
+) -> Optional[pd.Timestamp]:
+    update_parts = []
+    clean_file_path = get_clean_store_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    if os.path.isfile(clean_file_path):
+        update_parts.append(pd.read_parquet(clean_file_path, columns=[update_col])[update_col])
+    snapshot_dir = get_snapshot_dir(file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir)
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    for fn in manifest_df.loc[manifest_df["part"].isin(["base", "changes"]), "file_name"]:
+        update_parts.append(
+            pd.read_parquet(os.path.join(snapshot_dir, fn), columns=[update_col])[update_col]
+        )
+    if len(update_parts) == 0:
+        return None
+    return max(update_part.max() for update_part in update_parts)
+
+
+def count_socrata_records_updated_since(
+    latest_update: Optional[pd.Timestamp],
+    table_id: str,
+    update_col: str,
+    count_col: str,
+    socrata_domain: str,
+    scheme: str,
+) -> int:
+    assert latest_update is not None, f"No local copy of {table_id} to refresh; run its loader"
+    latest_update_str = latest_update.strftime(format="%Y-%m-%dT%H:%M:%S.000")
+    result_count = get_number_of_results_for_socrata_query(
+        filter_str=f"$where={update_col}>'{latest_update_str}'",
+        api_call_base=f"{scheme}://{socrata_domain}/resource/{table_id}.csv",
+        count_col=count_col,
+    )
+    return result_count
+
+
+def make_dataset_spec(
+    fetch: Optional[Callable[[], object]],
+    transform: Callable[[object, Dict], object],
+    check: Optional[Callable[[], bool]] = None,
+    depends_on: Optional[List[str]] = None,
+) -> Dict:
+    return {
+        "check": check,
+        "fetch": fetch,
+        "transform": transform,
+        "depends_on": depends_on if depends_on is not None else [],
+    }
+
+
+def get_refresh_dataset_specs(
+    root_dir: os.path = get_project_root_dir(),
+    socrata_domain: str = "data.cityofchicago.org",
+    scheme: str = "https",
+    force_repull_beats: bool = False,
+) -> Dict[str, Dict]:
+    def crimes_latest_update() -> Optional[pd.Timestamp]:
+        return get_latest_local_update(
+            file_name=CRIMES_FILE_NAME, dataset_dir="", update_col="updated_on", root_dir=root_dir
+        )
+
+    def violence_latest_update() -> Optional[pd.Timestamp]:
+        return get_latest_local_update(
+            file_name=VIOLENCE_FILE_NAME,
+            dataset_dir=VIOLENCE_DATASET_DIR,
+            update_col="updated",
+            root_dir=root_dir,
+        )
+
+    def check_crimes() -> bool:
+        result_count = count_socrata_records_updated_since(
+            latest_update=crimes_latest_update(),
+            table_id="ijzp-q8t2",
+            update_col="updated_on",
+            count_col="id",
+            socrata_domain=socrata_domain,
+            scheme=scheme,
+        )
+        return result_count > 0
+
+    def fetch_crimes() -> pd.DataFrame:
+        return get_chicago_crimes_data_since_latest_record(
+            crimes_gdf=pd.DataFrame({"updated_on": [crimes_latest_update()]}),
+            socrata_domain=socrata_domain,
+            scheme=scheme,
+        )
+
+    def transform_crimes(recent_crimes_df: pd.DataFrame, results: Dict) -> gpd.GeoDataFrame:
+        recent_crimes_gdf = transform_chicago_crimes_data(crimes_df=recent_crimes_df)
+        split_new_and_updated_records_and_save_them_to_file(
+            id_col="id",
+            running_df=None,
+            fresh_df=recent_crimes_gdf,
+            file_name=CRIMES_FILE_NAME,
+            dataset_dir="",
+            root_dir=root_dir,
+        )
+        return recent_crimes_gdf
+
+    def check_violence() -> bool:
+        result_count = count_socrata_records_updated_since(
+            latest_update=violence_latest_update(),
+            table_id="gumc-mgzr",
+            update_col="updated",
+            count_col="unique_id",
+            socrata_domain=socrata_domain,
+            scheme=scheme,
+        )
+        return result_count > 0
+
+    def fetch_violence() -> pd.DataFrame:
+        return get_socrata_table_records_updated_or_added_after_given_date(
+            table_id="gumc-mgzr",
+            socrata_domain=socrata_domain,
+            update_col="updated",
+            last_pull_date=violence_latest_update().strftime(format="%Y-%m-%dT%H:%M:%S.000"),
+            count_col="unique_id",
+            scheme=scheme,
+        )
+
+    def transform_violence(recent_df: pd.DataFrame, results: Dict) -> pd.DataFrame:
+        recent_df = transform_homicide_and_nfs_data(df=recent_df)
+        split_new_and_updated_homicide_and_shooting_records_and_save_them_to_file(
+            running_df=None, fresh_df=recent_df, root_dir=root_dir
+        )
+        return recent_df
+
+    def check_police_beats() -> bool:
+        # the beats export has no update column to count against, so unlike the record
+        # tables this isn't an upstream-change check: beats are pulled only when missing
+        # locally or when asked for
+        beats_file_path = os.path.join(root_dir, "data_raw", "Chicago_police_beats.geojson")
+        return force_repull_beats or not os.path.isfile(beats_file_path)
+
+    def fetch_police_beats() -> gpd.GeoDataFrame:
+        return read_raw_chicago_police_beats_geodata(
+            root_dir=root_dir,
+            url=(
+                f"{scheme}://{socrata_domain}/api/geospatial/aerh-rz74"
+                + "?method=export&format=GeoJSON"
+            ),
+            force_repull=True,
+        )
+
+    def transform_police_beats(
+        police_beats_gdf: gpd.GeoDataFrame, results: Dict
+    ) -> gpd.GeoDataFrame:
+        return police_beats_gdf
+
+    def load_or_build_daily_counts() -> Dict:
+        if os.path.isfile(get_daily_counts_file_path(root_dir=root_dir)):
+            return load_daily_counts(root_dir=root_dir)
+        # rebuilt from the latest state, so records earlier refreshes wrote to change logs
+        # are counted, and in their updated cells
+        count_columns = ["id", "date", "beat", "primary_type"]
+        snapshot_dir = get_snapshot_dir(
+            file_name=CRIMES_FILE_NAME, dataset_dir="", root_dir=root_dir
+        )
+        manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+        if (manifest_df["part"] == "base").sum() > 0:
+            crimes_df = load_snapshot_as_of(
+                snapshot_dir=snapshot_dir, id_col="id", columns=count_columns
+            )
+        else:
+            crimes_df = pd.read_parquet(
+                get_clean_store_file_path(
+                    file_name=CRIMES_FILE_NAME, dataset_dir="", root_dir=root_dir
+                ),
+                columns=count_columns,
+            )
+        return load_daily_counts(crimes_df=crimes_df, root_dir=root_dir)
+
+    def transform_beat_daily_counts(payload: None, results: Dict) -> Dict:
+        daily_counts = load_or_build_daily_counts()
+        if results.get("crimes") is not None:
+            daily_counts = update_daily_counts(
+                daily_counts=daily_counts, records_df=results["crimes"]
+            )
+            save_daily_counts(
+                daily_counts=daily_counts, file_path=get_daily_counts_file_path(root_dir=root_dir)
+            )
+        return daily_counts
+
+    def transform_beat_crime_counts(payload: None, results: Dict) -> gpd.GeoDataFrame:
+        police_beats_gdf = results.get("police_beats")
+        if police_beats_gdf is None:
+            police_beats_gdf = read_raw_chicago_police_beats_geodata(root_dir=root_dir)
+        daily_counts = results.get("beat_daily_counts")
+        if daily_counts is None:
+            daily_counts = load_or_build_daily_counts()
+        count_df = pd.DataFrame(
+            daily_counts["counts"].sum(axis=0),
+            index=pd.Index(daily_counts["beats"], name="beat"),
+            columns=daily_counts["primary_types"],
+        )
+        beat_counts_gdf = pd.merge(
+            left=police_beats_gdf, right=count_df, left_on="beat_num", right_index=True, how="left"
+        )
+        beat_counts_gdf[count_df.columns] = beat_counts_gdf[count_df.columns].fillna(0)
+        output_dir = os.path.join(root_dir, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        beat_counts_gdf.to_parquet(
+            os.path.join(output_dir, "crime_counts_per_beat.parquet.gzip"), compression="gzip"
+        )
+        return beat_counts_gdf
+
+    dataset_specs = {
+        "crimes": make_dataset_spec(
+            check=check_crimes, fetch=fetch_crimes, transform=transform_crimes
+        ),
+        "violence": make_dataset_spec(
+            check=check_violence, fetch=fetch_violence, transform=transform_violence
+        ),
+        "police_beats": make_dataset_spec(
+            check=check_police_beats, fetch=fetch_police_beats, transform=transform_police_beats
+        ),
+        "beat_daily_counts": make_dataset_spec(
+            fetch=None, transform=transform_beat_daily_counts, depends_on=["crimes"]
+        ),
+        "beat_crime_counts": make_dataset_spec(
+            fetch=None,
+            transform=transform_beat_crime_counts,
+            depends_on=["beat_daily_counts", "police_beats"],
+        ),
+    }
+    return dataset_specs
+
+
+def get_refresh_order(dataset_specs: Dict[str, Dict], datasets: List[str]) -> List[str]:
+    ordered, visiting = [], set()
+
+    def visit(name: str) -> None:
+        if name in ordered:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle involving dataset '{name}'")
+        if name not in dataset_specs:
+            raise ValueError(f"Unknown dataset '{name}'; expected one of {list(dataset_specs)}")
+        visiting.add(name)
+        for dependency in dataset_specs[name]["depends_on"]:
+            visit(dependency)
+        visiting.remove(name)
+        ordered.append(name)
+
+    for name in datasets:
+        visit(name)
+    return ordered
+
+
+def check_and_fetch_dataset(dataset_spec: Dict) -> Dict:
+    run_record = {"check_seconds": 0.0, "fetch_seconds": 0.0, "payload": None, "changed": True}
+    if dataset_spec["check"] is not None:
+        start = time.perf_counter()
+        run_record["changed"] = dataset_spec["check"]()
+        run_record["check_seconds"] = time.perf_counter() - start
+    if run_record["changed"] and dataset_spec["fetch"] is not None:
+        start = time.perf_counter()
+        run_record["payload"] = dataset_spec["fetch"]()
+        run_record["fetch_seconds"] = time.perf_counter() - start
+    return run_record
+
+
+def transform_dataset(dataset_spec: Dict, payload: object, results: Dict) -> Dict:
+    start = time.perf_counter()
+    result = dataset_spec["transform"](payload, results)
+    return {"result": result, "transform_seconds": time.perf_counter() - start}
+
+
+def run_refresh(
+    dataset_specs: Dict[str, Dict],
+    datasets: Optional[List[str]] = None,
+    fetch_workers: int = 3,
+    transform_workers: int = 2,
+) -> pd.DataFrame:
+    if datasets is None:
+        datasets = list(dataset_specs.keys())
+    refresh_order = get_refresh_order(dataset_specs=dataset_specs, datasets=datasets)
+    run_records = {
+        name: {"dataset": name, "status": "pending", "error": None} for name in refresh_order
+    }
+    results = {}
+    fetched = {}
+    fetch_futures: Dict[Future, str] = {}
+    transform_futures: Dict[Future, str] = {}
+
+    # fetches only wait on the network, so they all start at once; transforms wait on
+    # their own fetch and on every dependency's transform
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool, ThreadPoolExecutor(
+        max_workers=transform_workers
+    ) as transform_pool:
+        for name in refresh_order:
+            future = fetch_pool.submit(check_and_fetch_dataset, dataset_specs[name])
+            fetch_futures[future] = name
+
+        while fetch_futures or transform_futures:
+            done, _ = wait(
+                list(fetch_futures) + list(transform_futures), return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                if future in fetch_futures:
+                    name = fetch_futures.pop(future)
+                    try:
+                        fetched[name] = future.result()
+                    except Exception as err:
+                        run_records[name].update({"status": "failed", "error": repr(err)})
+                        continue
+                    run_records[name].update(
+                        {k: v for k, v in fetched[name].items() if k != "payload"}
+                    )
+                else:
+                    name = transform_futures.pop(future)
+                    try:
+                        transform_output = future.result()
+                    except Exception as err:
+                        run_records[name].update({"status": "failed", "error": repr(err)})
+                        continue
+                    results[name] = transform_output["result"]
+                    run_records[name].update(
+                        {
+                            "status": "refreshed",
+                            "transform_seconds": transform_output["transform_seconds"],
+                        }
+                    )
+
+            for name in refresh_order:
+                run_record = run_records[name]
+                if run_record["status"] != "pending" or name not in fetched:
+                    continue
+                dependency_statuses = [
+                    run_records[dep]["status"] for dep in dataset_specs[name]["depends_on"]
+                ]
+                if any(status in ["failed", "blocked"] for status in dependency_statuses):
+                    run_record["status"] = "blocked"
+                elif any(status in ["pending", "running"] for status in dependency_statuses):
+                    continue
+                elif not fetched[name]["changed"]:
+                    run_record["status"] = "skipped"
+                elif len(dependency_statuses) > 0 and all(
+                    status == "skipped" for status in dependency_statuses
+                ):
+                    run_record["status"] = "skipped"
+                else:
+                    run_record["status"] = "running"
+                    future = transform_pool.submit(
+                        transform_dataset,
+                        dataset_specs[name],
+                        fetched[name]["payload"],
+                        {dep: results.get(dep) for dep in dataset_specs[name]["depends_on"]},
+                    )
+                    transform_futures[future] = name
+
+    run_df = pd.DataFrame(
+        list(run_records.values()),
+        columns=[
+            "dataset",
+            "status",
+            "check_seconds",
+            "fetch_seconds",
+            "transform_seconds",
+            "error",
+        ],
+    )
+    return run_df
+
+
+def save_refresh_run_timings(
+    run_df: pd.DataFrame, run_started: datetime, root_dir: os.path = get_project_root_dir()
+) -> None:
+    output_dir = os.path.join(root_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    log_file_path = os.path.join(output_dir, "refresh_runs.csv")
+    run_df = run_df.copy()
+    run_df.insert(0, "run_started", run_started.strftime("%Y-%m-%dT%H:%M:%S"))
+    run_df.to_csv(log_file_path, mode="a", header=not os.path.isfile(log_file_path), index=False)
+
+
+def main(argv: Optional[List[str]] = None) -> pd.DataFrame:
+    parser = argparse.ArgumentParser(
+        description="Refresh the Chicago crimes, violence and police beat datasets."
+    )
+    parser.add_argument("datasets", nargs="*", help="datasets to refresh (default: all)")
+    parser.add_argument("--root-dir", default=get_project_root_dir())
+    parser.add_argument("--socrata-domain", default="data.cityofchicago.org")
+    parser.add_argument("--scheme", default="https")
+    parser.add_argument("--fetch-workers", type=int, default=3)
+    parser.add_argument("--transform-workers", type=int, default=2)
+    parser.add_argument(
+        "--force-repull-beats",
+        action="store_true",
+        help="re-download the police beats; they're otherwise only pulled when missing locally",
+    )
+    args = parser.parse_args(argv)
+
+    dataset_specs = get_refresh_dataset_specs(
+        root_dir=args.root_dir,
+        socrata_domain=args.socrata_domain,
+        scheme=args.scheme,
+        force_repull_beats=args.force_repull_beats,
+    )
+    run_started = datetime.now()
+    run_df = run_refresh(
+        dataset_specs=dataset_specs,
+        datasets=args.datasets if len(args.datasets) > 0 else None,
+        fetch_workers=args.fetch_workers,
+        transform_workers=args.transform_workers,
+    )
+    save_refresh_run_timings(run_df=run_df, run_started=run_started, root_dir=args.root_dir)
+    print(run_df.to_string(index=False))
+    return run_df
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+CRIMES_TABLE_ID = "ijzp-q8t2"
+VIOLENCE_TABLE_ID = "gumc-mgzr"
+POLICE_BEATS_GEOSPATIAL_ID = "aerh-rz74"
+SOCRATA_DT_FORMAT = "%Y-%m-%dT%H:%M:%S.000"
+BEATS = [111, 112, 113, 114, 121, 122, 1011, 1012, 1013, 1014, 2532, 2533]
+PRIMARY_TYPES = {
+    "THEFT": ("0820", "$500 AND UNDER", "06"),
+    "BATTERY": ("0486", "DOMESTIC BATTERY SIMPLE", "08B"),
+    "ROBBERY": ("031A", "ARMED: HANDGUN", "03"),
+    "HOMICIDE": ("0110", "FIRST DEGREE MURDER", "01A"),
+    "NARCOTICS": ("1811", "POSS: CANNABIS 30GMS OR LESS", "18"),
+}
+
+
+def make_synthetic_crimes_table(
+    n_records: int, rng: np.random.Generator, first_id: int = 1, start_date: str = "2015-01-01"
+) -> pd.DataFrame:
+    ids = np.arange(first_id, first_id + n_records)
+    dates = pd.Timestamp(start_date) + pd.to_timedelta(
+        rng.integers(0, 7 * 365 * 24 * 3600, n_records), unit="s"
+    )
+    primary_types = rng.choice(list(PRIMARY_TYPES.keys()), n_records)
+    beats = rng.choice(BEATS, n_records)
+    latitudes = 41.65 + 0.35 * rng.random(n_records)
+    longitudes = -87.85 + 0.3 * rng.random(n_records)
+    crimes_df = pd.DataFrame(
+        {
+            "id": ids,
+            "case_number": [f"J{i:07d}" for i in ids],
+            "date": dates,
+            "block": [f"{i % 120:03d}XX W MADISON ST" for i in ids],
+            "iucr": [PRIMARY_TYPES[pt][0] for pt in primary_types],
+            "primary_type": primary_types,
+            "description": [PRIMARY_TYPES[pt][1] for pt in primary_types],
+            "location_description": rng.choice(["STREET", "RESIDENCE", "APARTMENT"], n_records),
+            "arrest": rng.random(n_records) < 0.2,
+            "domestic": rng.random(n_records) < 0.15,
+            "beat": beats,
+            "district": beats // 100,
+            "ward": rng.integers(1, 51, n_records),
+            "community_area": rng.integers(1, 78, n_records),
+            "fbi_code": [PRIMARY_TYPES[pt][2] for pt in primary_types],
+            "x_coordinate": rng.integers(1100000, 1200000, n_records),
+            "y_coordinate": rng.integers(1800000, 1950000, n_records),
+            "year": dates.year,
+            "updated_on": dates
+            + pd.to_timedelta(rng.integers(1, 30 * 24 * 3600, n_records), unit="s"),
+            "latitude": latitudes.round(9),
+            "longitude": longitudes.round(9),
+        }
+    )
+    crimes_df["location"] = [f"({lat}, {lon})" for lat, lon in zip(latitudes, longitudes)]
+    return crimes_df
+
+
+def make_synthetic_violence_table(
+    n_records: int, rng: np.random.Generator, first_id: int = 1, start_date: str = "2015-01-01"
+) -> pd.DataFrame:
+    ids = np.arange(first_id, first_id + n_records)
+    dates = pd.Timestamp(start_date) + pd.to_timedelta(
+        rng.integers(0, 7 * 365 * 24 * 3600, n_records), unit="s"
+    )
+    is_homicide = rng.random(n_records) < 0.2
+    victimization = np.where(is_homicide, "HOMICIDE", "NON-FATAL SHOOTING")
+    beats = rng.choice(BEATS, n_records)
+    violence_df = pd.DataFrame(
+        {
+            "case_number": [f"J{i:07d}" for i in ids],
+            "date": dates,
+            "block": [f"{i % 120:03d}XX S STATE ST" for i in ids],
+            "victimization_primary": victimization,
+            "incident_primary": victimization,
+            "gunshot_injury_i": np.where(rng.random(n_records) < 0.9, "YES", "NO"),
+            "unique_id": [
+                f"{'HOM' if h else 'SHOOT'}-J{i:07d}-#1" for i, h in zip(ids, is_homicide)
+            ],
+            "zip_code": rng.integers(60601, 60661, n_records),
+            "ward": rng.integers(1, 51, n_records),
+            "community_area": rng.choice(["AUSTIN", "ENGLEWOOD", "WEST GARFIELD PARK"], n_records),
+            "street_outreach_organization": "NONE",
+            "area": rng.integers(1, 6, n_records),
+            "district": beats // 100,
+            "beat": beats,
+            "age": rng.choice(["0-19", "20-29", "30-39", "40-49", "50-59"], n_records),
+            "sex": rng.choice(["M", "F"], n_records),
+            "race": rng.choice(["BLK", "WHI", "WWH", "API"], n_records),
+            "victimization_fbi_cd": np.where(is_homicide, "01A", "04B"),
+            "incident_fbi_cd": np.where(is_homicide, "01A", "04B"),
+            "victimization_fbi_descr": np.where(is_homicide, "HOMICIDE", "AGG BATTERY"),
+            "incident_fbi_descr": np.where(is_homicide, "HOMICIDE", "AGG BATTERY"),
+            "victimization_iucr_cd": np.where(is_homicide, "0110", "041A"),
+            "incident_iucr_cd": np.where(is_homicide, "0110", "041A"),
+            "victimization_iucr_secondary": np.where(is_homicide, "FIRST DEGREE MURDER", "HANDGUN"),
+            "incident_iucr_secondary": np.where(is_homicide, "FIRST DEGREE MURDER", "HANDGUN"),
+            "month": dates.month,
+            "day_of_week": dates.dayofweek + 1,
+            "hour": dates.hour,
+            "location_description": rng.choice(["STREET", "ALLEY", "SIDEWALK"], n_records),
+            "state_house_district": rng.integers(1, 119, n_records),
+            "state_senate_district": rng.integers(1, 60, n_records),
+            "updated": dates
+            + pd.to_timedelta(rng.integers(1, 30 * 24 * 3600, n_records), unit="s"),
+            "latitude": (41.65 + 0.35 * rng.random(n_records)).round(9),
+            "longitude": (-87.85 + 0.3 * rng.random(n_records)).round(9),
+        }
+    )
+    return violence_df
+
+
+def make_synthetic_police_beats_geojson(beats: List[int] = BEATS) -> Dict:
+    features = []
+    for i, beat in enumerate(beats):
+        x0, y0 = -87.85 + 0.05 * (i % 6), 41.65 + 0.05 * (i // 6)
+        ring = [[x0, y0], [x0 + 0.05, y0], [x0 + 0.05, y0 + 0.05], [x0, y0 + 0.05], [x0, y0]]
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {
+                    "beat_num": str(beat).zfill(4),
+                    "beat": str(beat % 10),
+                    "district": str(beat // 100).zfill(2),
+                    "sector": str((beat // 10) % 10),
+                },
+                "geometry": {"type": "MultiPolygon", "coordinates": [[ring]]},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def make_socrata_standin_state(
+    n_crimes: int = 10000,
+    n_violence: int = 2000,
+    latency: float = 0.0,
+    failure_rate: float = 0.0,
+    seed: int = 0,
+) -> Dict:
+    rng = np.random.default_rng(seed)
+    state = {
+        "tables": {
+            CRIMES_TABLE_ID: make_synthetic_crimes_table(n_records=n_crimes, rng=rng),
+            VIOLENCE_TABLE_ID: make_synthetic_violence_table(n_records=n_violence, rng=rng),
+        },
+        "geojson": {POLICE_BEATS_GEOSPATIAL_ID: make_synthetic_police_beats_geojson()},
+        "latency": latency,
+        "failure_rate": failure_rate,
+        "fail_requests": set(),
+        "request_count": 0,
+        "rng": rng,
+        "lock": threading.Lock(),
+    }
+    return state
+
+
+def apply_upstream_changes(
+    state: Dict, table_id: str, n_new: int, n_updated: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    if table_id == CRIMES_TABLE_ID:
+        id_col, update_col, make_table = "id", "updated_on", make_synthetic_crimes_table
+    else:
+        id_col, update_col, make_table = "unique_id", "updated", make_synthetic_violence_table
+    with state["lock"]:
+        df = state["tables"][table_id]
+        rng = state["rng"]
+        change_time = df[update_col].max().ceil("s") + pd.Timedelta(seconds=1)
+
+        updated_positions = rng.choice(len(df), size=n_updated, replace=False)
+        df = df.copy()
+        df.iloc[updated_positions, df.columns.get_loc(update_col)] = change_time
+        if table_id == CRIMES_TABLE_ID:
+            arrest_col = df.columns.get_loc("arrest")
+            df.iloc[updated_positions, arrest_col] = ~df.iloc[updated_positions, arrest_col]
+        else:
+            age_col = df.columns.get_loc("age")
+            df.iloc[updated_positions, age_col] = "60-69"
+
+        next_id = int(df["case_number"].str[1:].astype(int).max()) + 1
+        new_df = make_table(n_records=n_new, rng=rng, first_id=next_id)
+        new_df[update_col] = change_time
+        state["tables"][table_id] = pd.concat([df, new_df], ignore_index=True)
+    return new_df[id_col].to_numpy(), df[id_col].to_numpy()[updated_positions]
+
+
+def parse_soql_value(value: str, series: pd.Series) -> object:
+    value = value.strip()
+    if value.startswith("'") and value.endswith("'"):
+        value = value[1:-1]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.Timestamp(value)
+    if pd.api.types.is_bool_dtype(series):
+        return value.lower() == "true"
+    if pd.api.types.is_numeric_dtype(series):
+        return float(value)
+    return value
+
+
+def apply_soql_where(df: pd.DataFrame, where_str: str) -> pd.DataFrame:
+    comparisons = {
+        ">=": lambda s, v: s >= v,
+        "<=": lambda s, v: s <= v,
+        "!=": lambda s, v: s != v,
+        ">": lambda s, v: s > v,
+        "<": lambda s, v: s < v,
+        "=": lambda s, v: s == v,
+    }
+    mask = pd.Series(True, index=df.index)
+    for clause in re.split(r"\s+and\s+", where_str, flags=re.IGNORECASE):
+        match = re.match(r"^\s*(\w+)\s*(>=|<=|!=|=|>|<)\s*(.+?)\s*$", clause)
+        if match is None or match.group(1) not in df.columns:
+            raise ValueError(f"Unsupported $where clause: {clause}")
+        col, op, value = match.groups()
+        mask &= comparisons[op](df[col], parse_soql_value(value=value, series=df[col]))
+    return df.loc[mask]
+
+
+def apply_soql_order(df: pd.DataFrame, order_str: str) -> pd.DataFrame:
+    sort_cols, ascending = [], []
+    for term in order_str.split(","):
+        parts = term.split()
+        sort_cols.append(parts[0])
+        ascending.append(len(parts) == 1 or parts[1].upper() != "DESC")
+    return df.sort_values(by=sort_cols, ascending=ascending, kind="stable")
+
+
+def format_socrata_csv(df: pd.DataFrame) -> str:
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].map({True: "true", False: "false"})
+    return df.to_csv(index=False, date_format=SOCRATA_DT_FORMAT)
+
+
+def run_soql_query(df: pd.DataFrame, params: Dict[str, str]) -> str:
+    if "$where" in params:
+        df = apply_soql_where(df=df, where_str=params["$where"])
+    select_str = params.get("$select", "*").strip()
+    count_match = re.match(r"^count\((\w+|\*)\)$", select_str, flags=re.IGNORECASE)
+    if count_match is not None:
+        count_col = count_match.group(1)
+        n_results = len(df) if count_col == "*" else int(df[count_col].notna().sum())
+        return f'"count_{count_col}"\n"{n_results}"\n'
+    if "$order" in params:
+        df = apply_soql_order(df=df, order_str=params["$order"])
+    offset = int(params.get("$offset", 0))
+    limit = int(params.get("$limit", 1000))
+    df = df.iloc[offset : offset + limit]
+    if select_str != "*":
+        df = df[[col.strip() for col in select_str.split(",")]]
+    return format_socrata_csv(df=df)
+
+
+def make_socrata_standin_handler(state: Dict) -> type:
+    class SocrataStandinHandler(BaseHTTPRequestHandler):
+        def send_text(self, status: int, body: str, content_type: str) -> None:
+            encoded_body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(encoded_body)))
+            self.end_headers()
+            self.wfile.write(encoded_body)
+
+        def do_GET(self) -> None:
+            with state["lock"]:
+                state["request_count"] += 1
+                fail = (
+                    state["request_count"] in state["fail_requests"]
+                    or state["rng"].random() < state["failure_rate"]
+                )
+                tables = dict(state["tables"])
+            if state["latency"] > 0:
+                time.sleep(state["latency"])
+            if fail:
+                self.send_text(503, '{"error": "injected failure"}', "application/json")
+                return
+
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+            resource_match = re.match(r"^/resource/([\w-]+)\.csv$", url.path)
+            geo_match = re.match(r"^/api/geospatial/([\w-]+)$", url.path)
+            if resource_match is not None and resource_match.group(1) in tables:
+                try:
+                    body = run_soql_query(df=tables[resource_match.group(1)], params=params)
+                except (KeyError, ValueError) as err:
+                    self.send_text(400, json.dumps({"error": str(err)}), "application/json")
+                    return
+                self.send_text(200, body, "text/csv")
+            elif geo_match is not None and geo_match.group(1) in state["geojson"]:
+                body = json.dumps(state["geojson"][geo_match.group(1)])
+                self.send_text(200, body, "application/vnd.geo+json")
+            else:
+                self.send_text(404, '{"error": "not found"}', "application/json")
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return SocrataStandinHandler
+
+
+def start_socrata_standin(
+    state: Dict, host: str = "127.0.0.1", port: int = 0
+) -> Tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer((host, port), make_socrata_standin_handler(state=state))
+    server.daemon_threads = True
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    socrata_domain = f"{host}:{server.server_address[1]}"
+    return server, socrata_domain
+
+
+def stop_socrata_standin(server: ThreadingHTTPServer) -> None:
+    server.shutdown()
+    server.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve synthetic Chicago crimes and violence tables with SoQL paging."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--crimes", type=int, default=10000, help="synthetic crime records")
+    parser.add_argument("--violence", type=int, default=2000, help="synthetic victim records")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    state = make_socrata_standin_state(
+        n_crimes=args.crimes,
+        n_violence=args.violence,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+    server, socrata_domain = start_socrata_standin(state=state, host=args.host, port=args.port)
+    print(f"Serving a Socrata stand-in on http://{socrata_domain} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_socrata_standin(server=server)
+
+
+if __name__ == "__main__":
+    main()
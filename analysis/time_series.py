@@ -0,0 +1,229 @@
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils import get_project_root_dir
+
+
+def get_daily_counts_file_path(
+    file_name: str = "Crimes_-_2001_to_present", root_dir: os.path = get_project_root_dir()
+) -> os.path:
+    return os.path.join(root_dir, "data_clean", f"{file_name}_daily_beat_type_counts.npz")
+
+
+def make_empty_daily_counts(
+    start_date: str, beats: List[int], primary_types: List[str], n_days: int = 0
+) -> Dict:
+    daily_counts = {
+        "start_date": pd.Timestamp(start_date).normalize(),
+        "beats": np.array(sorted(beats), dtype="int64"),
+        "primary_types": np.array(sorted(primary_types), dtype=str),
+        "counts": np.zeros((n_days, len(beats), len(primary_types)), dtype="int32"),
+        "ids": np.array([], dtype="int64"),
+        "cells": np.array([], dtype="int64"),
+    }
+    return daily_counts
+
+
+def get_daily_counts_dates(daily_counts: Dict) -> pd.DatetimeIndex:
+    return pd.date_range(
+        start=daily_counts["start_date"], periods=daily_counts["counts"].shape[0], freq="D"
+    )
+
+
+def expand_daily_counts_axes(
+    daily_counts: Dict, end_date: pd.Timestamp, beats: np.ndarray, primary_types: np.ndarray
+) -> Dict:
+    old_counts = daily_counts["counts"]
+    new_beats = np.union1d(daily_counts["beats"], beats).astype("int64")
+    new_types = np.union1d(daily_counts["primary_types"], primary_types).astype(str)
+    n_days = max((end_date.normalize() - daily_counts["start_date"]).days + 1, old_counts.shape[0])
+    if (
+        n_days == old_counts.shape[0]
+        and len(new_beats) == len(daily_counts["beats"])
+        and len(new_types) == len(daily_counts["primary_types"])
+    ):
+        return daily_counts
+
+    beat_positions = np.searchsorted(new_beats, daily_counts["beats"])
+    type_positions = np.searchsorted(new_types, daily_counts["primary_types"])
+    counts = np.zeros((n_days, len(new_beats), len(new_types)), dtype=old_counts.dtype)
+    counts[: old_counts.shape[0], beat_positions[:, None], type_positions[None, :]] = old_counts
+
+    old_day, old_beat, old_type = np.unravel_index(daily_counts["cells"], old_counts.shape)
+    daily_counts["cells"] = np.ravel_multi_index(
+        (old_day, beat_positions[old_beat], type_positions[old_type]), counts.shape
+    ).astype("int64")
+    daily_counts["beats"] = new_beats
+    daily_counts["primary_types"] = new_types
+    daily_counts["counts"] = counts
+    return daily_counts
+
+
+def get_cells_for_records(daily_counts: Dict, df: pd.DataFrame) -> np.ndarray:
+    day_positions = (
+        (df["date"].dt.normalize() - daily_counts["start_date"]).dt.days.to_numpy().astype("int64")
+    )
+    beat_positions = np.searchsorted(daily_counts["beats"], df["beat"].to_numpy(dtype="int64"))
+    type_positions = np.searchsorted(
+        daily_counts["primary_types"], df["primary_type"].astype(str).to_numpy(dtype=str)
+    )
+    cells = np.ravel_multi_index(
+        (day_positions, beat_positions, type_positions), daily_counts["counts"].shape
+    ).astype("int64")
+    return cells
+
+
+def remove_tallied_records(daily_counts: Dict, record_ids: np.ndarray) -> Dict:
+    known_ids = daily_counts["ids"]
+    if len(known_ids) == 0:
+        return daily_counts
+    id_positions = np.minimum(np.searchsorted(known_ids, record_ids), len(known_ids) - 1)
+    id_positions = id_positions[known_ids[id_positions] == record_ids]
+    np.subtract.at(daily_counts["counts"].reshape(-1), daily_counts["cells"][id_positions], 1)
+    keep_mask = np.ones(len(known_ids), dtype=bool)
+    keep_mask[id_positions] = False
+    daily_counts["ids"] = known_ids[keep_mask]
+    daily_counts["cells"] = daily_counts["cells"][keep_mask]
+    return daily_counts
+
+
+def update_daily_counts(daily_counts: Dict, records_df: pd.DataFrame) -> Dict:
+    records_df = records_df.drop_duplicates(subset="id", keep="last")
+    # updated records move their count out of the cell they were previously tallied in
+    daily_counts = remove_tallied_records(
+        daily_counts=daily_counts, record_ids=records_df["id"].to_numpy(dtype="int64")
+    )
+    records_df = records_df.loc[
+        records_df["date"].notna()
+        & records_df["beat"].notna()
+        & records_df["primary_type"].notna()
+        & (records_df["date"] >= daily_counts["start_date"])
+    ]
+    if len(records_df) == 0:
+        return daily_counts
+    daily_counts = expand_daily_counts_axes(
+        daily_counts=daily_counts,
+        end_date=records_df["date"].max(),
+        beats=records_df["beat"].to_numpy(dtype="int64"),
+        primary_types=records_df["primary_type"].astype(str).unique(),
+    )
+    new_cells = get_cells_for_records(daily_counts=daily_counts, df=records_df)
+    np.add.at(daily_counts["counts"].reshape(-1), new_cells, 1)
+
+    all_ids = np.concatenate([daily_counts["ids"], records_df["id"].to_numpy(dtype="int64")])
+    all_cells = np.concatenate([daily_counts["cells"], new_cells])
+    sort_order = np.argsort(all_ids, kind="stable")
+    daily_counts["ids"] = all_ids[sort_order]
+    daily_counts["cells"] = all_cells[sort_order]
+    return daily_counts
+
+
+def build_daily_counts(crimes_df: pd.DataFrame, start_date: str = "2015-01-01") -> Dict:
+    daily_counts = make_empty_daily_counts(start_date=start_date, beats=[], primary_types=[])
+    daily_counts = update_daily_counts(daily_counts=daily_counts, records_df=crimes_df)
+    return daily_counts
+
+
+def save_daily_counts(daily_counts: Dict, file_path: os.path) -> None:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    np.savez(
+        file_path,
+        start_date=np.array(daily_counts["start_date"].strftime("%Y-%m-%d")),
+        beats=daily_counts["beats"],
+        primary_types=daily_counts["primary_types"],
+        counts=daily_counts["counts"],
+        ids=daily_counts["ids"],
+        cells=daily_counts["cells"],
+    )
+
+
+def load_daily_counts(
+    crimes_df: Optional[pd.DataFrame] = None,
+    start_date: str = "2015-01-01",
+    root_dir: os.path = get_project_root_dir(),
+    force_remake: bool = False,
+) -> Dict:
+    file_path = get_daily_counts_file_path(root_dir=root_dir)
+    if not os.path.isfile(file_path) or force_remake:
+        assert crimes_df is not None, "crimes_df is needed to build the daily counts"
+        daily_counts = build_daily_counts(crimes_df=crimes_df, start_date=start_date)
+        save_daily_counts(daily_counts=daily_counts, file_path=file_path)
+    else:
+        with np.load(file_path) as npz_file:
+            daily_counts = {
+                "start_date": pd.Timestamp(str(npz_file["start_date"])),
+                "beats": npz_file["beats"],
+                "primary_types": npz_file["primary_types"],
+                "counts": npz_file["counts"],
+                "ids": npz_file["ids"],
+                "cells": npz_file["cells"],
+            }
+    return daily_counts
+
+
+def update_persisted_daily_counts(
+    recent_crimes_df: pd.DataFrame, root_dir: os.path = get_project_root_dir()
+) -> Dict:
+    daily_counts = load_daily_counts(root_dir=root_dir)
+    daily_counts = update_daily_counts(daily_counts=daily_counts, records_df=recent_crimes_df)
+    save_daily_counts(
+        daily_counts=daily_counts, file_path=get_daily_counts_file_path(root_dir=root_dir)
+    )
+    return daily_counts
+
+
+def compute_trailing_zscores(
+    daily_counts: Dict, window: int = 28, n_recent_days: int = 1, min_std: float = 0.5
+) -> Dict[str, np.ndarray]:
+    counts = daily_counts["counts"]
+    n_days = min(n_recent_days, max(counts.shape[0] - window, 0))
+    recent_window = counts[counts.shape[0] - n_days - window :].astype("float64")
+
+    # trailing baseline excludes the day being scored
+    zeros = np.zeros((1,) + recent_window.shape[1:])
+    sums = np.concatenate([zeros, np.cumsum(recent_window, axis=0)])
+    sq_sums = np.concatenate([zeros, np.cumsum(recent_window**2, axis=0)])
+    baseline_sums = sums[window:-1] - sums[: -window - 1]
+    baseline_sq_sums = sq_sums[window:-1] - sq_sums[: -window - 1]
+    rolling_means = baseline_sums / window
+    rolling_vars = np.maximum(baseline_sq_sums / window - rolling_means**2, 0)
+    rolling_stds = np.maximum(np.sqrt(rolling_vars), min_std)
+    observed = recent_window[window:]
+    zscores = (observed - rolling_means) / rolling_stds
+    return {
+        "dates": get_daily_counts_dates(daily_counts=daily_counts)[counts.shape[0] - n_days :],
+        "counts": observed,
+        "rolling_means": rolling_means,
+        "rolling_stds": rolling_stds,
+        "zscores": zscores,
+    }
+
+
+def get_beat_anomalies(
+    daily_counts: Dict,
+    window: int = 28,
+    n_recent_days: int = 1,
+    z_threshold: float = 3.0,
+    min_count: int = 2,
+) -> pd.DataFrame:
+    stats = compute_trailing_zscores(
+        daily_counts=daily_counts, window=window, n_recent_days=n_recent_days
+    )
+    day_idx, beat_idx, type_idx = np.nonzero(
+        (stats["zscores"] >= z_threshold) & (stats["counts"] >= min_count)
+    )
+    anomalies_df = pd.DataFrame(
+        {
+            "date": stats["dates"][day_idx],
+            "beat": daily_counts["beats"][beat_idx],
+            "primary_type": daily_counts["primary_types"][type_idx],
+            "count": stats["counts"][day_idx, beat_idx, type_idx].astype("int64"),
+            "rolling_mean": stats["rolling_means"][day_idx, beat_idx, type_idx],
+            "zscore": stats["zscores"][day_idx, beat_idx, type_idx],
+        }
+    )
+    anomalies_df = anomalies_df.sort_values(by="zscore", ascending=False).reset_index(drop=True)
+    return anomalies_df
@@ -1,16 +1,22 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import io
 import os
 import re
+import warnings
 from typing import Dict, List, Union, Optional
 from urllib.request import urlretrieve
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from pandas.api.types import CategoricalDtype, is_datetime64_any_dtype
 import requests
 from shapely.geometry import Point
 
+# small enough that a by-position gather only decompresses the row groups it needs
+CLEAN_STORE_ROW_GROUP_SIZE = 100_000
+
 
 def get_project_root_dir() -> os.path:
     if "__file__" in globals().keys():
@@ -200,37 +206,97 @@ def map_column_to_boolean_values(
     return df
 
 
+def get_memory_usage_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024**2
+
+
+def downcast_numeric_columns(df: pd.DataFrame) -> pd.DataFrame:
+    for col in df.columns:
+        if pd.api.types.is_bool_dtype(df[col]) or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="float")
+    return df
+
+
+def read_parquet_without_geometry(file_path: os.path) -> pd.DataFrame:
+    # a plain frame without the point column, so no shapely object is ever built
+    columns = [col for col in pq.read_schema(file_path).names if col != "geometry"]
+    df = pd.read_parquet(file_path, columns=columns)
+    return df
+
+
+def compact_dataframe(
+    df: pd.DataFrame,
+    string_columns: List[str],
+    dictionary_columns: List[str],
+    boolean_columns: List[str],
+    report_memory_usage: bool = True,
+) -> pd.DataFrame:
+    # point geometries are rebuildable from longitude/latitude via
+    # geospatialize_df_with_point_geometries(), so only the coordinate arrays are kept
+    has_geometry = "geometry" in df.columns
+    if has_geometry:
+        df = pd.DataFrame(df.drop(columns=["geometry"]))
+    # memory_usage only sees a pointer per shapely object, so the geometry column is left
+    # out of the "before" figure rather than under-reported
+    mem_before = get_memory_usage_mb(df=df) if report_memory_usage else None
+    df = downcast_numeric_columns(df=df)
+    for col in [col for col in boolean_columns if col in df.columns]:
+        df = map_column_to_boolean_values(
+            df=df, input_col=col, true_values=[True, "true", "True", "TRUE", "Y", "YES"]
+        )
+    for col in [col for col in string_columns if col in df.columns]:
+        df[col] = df[col].astype("string[pyarrow]")
+    df = typeset_simple_category_columns(
+        df=df, category_columns=[col for col in dictionary_columns if col in df.columns]
+    )
+    if report_memory_usage:
+        mem_after = get_memory_usage_mb(df=df)
+        print(
+            f"Memory usage: {mem_before:,.1f} MB -> {mem_after:,.1f} MB "
+            + f"({1 - mem_after / mem_before:.0%} smaller)"
+        )
+        if has_geometry:
+            print(
+                "Not counted above: the dropped geometry column, one shapely point per row, "
+                + "which memory_usage can't measure"
+            )
+    return df
+
+
 def get_number_of_results_for_socrata_query(
     filter_str: str, api_call_base: str, count_col: str = "id"
 ) -> int:
     api_call = f"{api_call_base}?$select=count({count_col})&{filter_str}"
     resp = requests.get(api_call)
-    if resp.status_code == 200:
-        result_count_str = resp.content.decode("utf-8").replace('"', "")
-        counts = re.findall(r"\n([\d]*)\n", result_count_str)
-        if len(counts) > 0:
-            result_count = int(counts[0])
-            return result_count
-    else:
-        return requests.HTTPError
+    resp.raise_for_status()
+    result_count_str = resp.content.decode("utf-8").replace('"', "")
+    counts = re.findall(r"\n([\d]+)", result_count_str)
+    if len(counts) == 0:
+        raise ValueError(f"Couldn't parse a count from the response to {api_call}")
+    result_count = int(counts[0])
+    return result_count
 
 
 def make_api_call_for_socrata_csv_data(api_call: str) -> pd.DataFrame:
     resp = requests.get(api_call)
-    if resp.status_code == 200:
-        return pd.read_csv(io.StringIO(resp.content.decode("utf-8")))
-    else:
-        return requests.HTTPError
+    resp.raise_for_status()
+    return pd.read_csv(io.StringIO(resp.content.decode("utf-8")))
 
 
 def read_raw_chicago_police_beats_geodata(
     root_dir: os.path = get_project_root_dir(),
+    url: str = "https://data.cityofchicago.org/api/geospatial/aerh-rz74?method=export&format=GeoJSON",
+    force_repull: bool = False,
 ) -> gpd.GeoDataFrame:
     police_beats_gdf = extract_file_from_url(
         file_path=os.path.join(root_dir, "data_raw", "Chicago_police_beats.geojson"),
-        url="https://data.cityofchicago.org/api/geospatial/aerh-rz74?method=export&format=GeoJSON",
+        url=url,
         data_format="geojson",
-        force_repull=False,
+        force_repull=force_repull,
         return_df=True,
     )
     police_beats_gdf["beat_num"] = police_beats_gdf["beat_num"].astype("int64")
@@ -246,20 +312,25 @@ def get_latest_update_date(
 
 
 def get_socrata_table_records_updated_or_added_after_given_date(
-    table_id: str, socrata_domain: str, update_col: str, last_pull_date: str, count_col: str
+    table_id: str,
+    socrata_domain: str,
+    update_col: str,
+    last_pull_date: str,
+    count_col: str,
+    scheme: str = "https",
+    page_size: int = 1000,
 ) -> pd.DataFrame:
-    api_call_base = f"https://{socrata_domain}/resource/{table_id}.csv"
+    api_call_base = f"{scheme}://{socrata_domain}/resource/{table_id}.csv"
     filter_str = f"$where={update_col}>'{last_pull_date}'"
     result_count = get_number_of_results_for_socrata_query(
         filter_str=filter_str, api_call_base=api_call_base, count_col=count_col
     )
+    # a single page when there's nothing new, so the result still has the table's columns
+    n_pages = max(-(-result_count // page_size), 1)
     df_parts = []
-    for i in range((result_count // 1000) + 1):
-        offset = i * 1000
-        if result_count < (offset + 1000):
-            limit = result_count % 1000
-        else:
-            limit = 1000
+    for i in range(n_pages):
+        offset = i * page_size
+        limit = min(page_size, result_count - offset)
         pagination_str = f"$limit={limit}&$offset={offset}&$order={count_col}"
         api_call = f"{api_call_base}?{filter_str}&{pagination_str}"
         df_parts.append(make_api_call_for_socrata_csv_data(api_call))
@@ -268,52 +339,457 @@ def get_socrata_table_records_updated_or_added_after_given_date(
     return recent_updates_df
 
 
-def save_fresh_records_to_file(
-    record_df: pd.DataFrame,
+def get_clean_store_file_path(
+    file_name: str, dataset_dir: str, root_dir: os.path = get_project_root_dir()
+) -> os.path:
+    return os.path.join(root_dir, "data_clean", dataset_dir, f"{file_name}.parquet.gzip")
+
+
+def get_snapshot_dir(
+    file_name: str, dataset_dir: str, root_dir: os.path = get_project_root_dir()
+) -> os.path:
+    return os.path.join(root_dir, "data_clean", dataset_dir, f"{file_name}_snapshots")
+
+
+def get_snapshot_pulled_at_str(file_name: str) -> str:
+    pulled_at_str = file_name[file_name.index("_") + 1 :].split(".")[0]
+    # files written before microseconds were added to the names
+    if pulled_at_str.count("_") == 3:
+        pulled_at_str = f"{pulled_at_str}_000000"
+    return pulled_at_str
+
+
+def get_snapshot_manifest(snapshot_dir: os.path) -> pd.DataFrame:
+    os.makedirs(snapshot_dir, exist_ok=True)
+    snapshot_files = [fn for fn in os.listdir(snapshot_dir) if fn.endswith(".parquet.gzip")]
+    manifest_df = pd.DataFrame(
+        {
+            "file_name": snapshot_files,
+            "part": [fn.split("_")[0] for fn in snapshot_files],
+            "pulled_at": pd.to_datetime(
+                [get_snapshot_pulled_at_str(file_name=fn) for fn in snapshot_files],
+                format="%Y_%m_%d_%H%M%S_%f",
+            ),
+        },
+        columns=["file_name", "part", "pulled_at"],
+    )
+    manifest_df = manifest_df.sort_values(by=["pulled_at", "part"]).reset_index(drop=True)
+    return manifest_df
+
+
+def get_snapshot_file_path(snapshot_dir: os.path, part: str, pulled_at: datetime) -> os.path:
+    assert part in ["base", "changes", "priors"]
+    # to the microsecond, so back-to-back writes (two quick refreshes, a full repull followed
+    # by a split) land in separate files
+    pulled_at_str = pulled_at.strftime("%Y_%m_%d_%H%M%S_%f")
+    return os.path.join(snapshot_dir, f"{part}_{pulled_at_str}.parquet.gzip")
+
+
+def get_new_snapshot_file_path(snapshot_dir: os.path, part: str, pulled_at: datetime) -> os.path:
+    snapshot_file_path = get_snapshot_file_path(
+        snapshot_dir=snapshot_dir, part=part, pulled_at=pulled_at
+    )
+    if os.path.isfile(snapshot_file_path):
+        raise FileExistsError(f"Refusing to overwrite snapshot file {snapshot_file_path}")
+    return snapshot_file_path
+
+
+def restore_categorical_dtypes(df: pd.DataFrame, reference_df: pd.DataFrame) -> pd.DataFrame:
+    for col in reference_df.columns:
+        ref_dtype = reference_df[col].dtype
+        if isinstance(ref_dtype, CategoricalDtype) and col in df.columns:
+            if df[col].dropna().isin(ref_dtype.categories).all():
+                df[col] = df[col].astype(ref_dtype)
+            else:
+                df[col] = df[col].astype("category")
+    return df
+
+
+def save_base_snapshot(
+    df: pd.DataFrame,
+    snapshot_dir: os.path,
+    pulled_at: Optional[datetime] = None,
+    id_col: Optional[str] = None,
+) -> None:
+    if pulled_at is None:
+        pulled_at = datetime.today()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    if id_col is not None:
+        # sorted, so each row group covers a narrow id range and by-id reads can skip the
+        # row groups whose id statistics rule them out
+        df = df.sort_values(by=id_col, kind="stable").reset_index(drop=True)
+    df.to_parquet(
+        get_new_snapshot_file_path(snapshot_dir=snapshot_dir, part="base", pulled_at=pulled_at),
+        compression="gzip",
+        row_group_size=CLEAN_STORE_ROW_GROUP_SIZE,
+    )
+
+
+def seed_base_snapshot_from_clean_store(
+    id_col: str,
+    file_name: str,
+    dataset_dir: str,
+    before: datetime,
+    root_dir: os.path = get_project_root_dir(),
+) -> None:
+    # change logs need a base to be replayed onto; the clean store is the state they were
+    # pulled against, so it's copied in, dated no later than just before the changes
+    snapshot_dir = get_snapshot_dir(file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir)
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    clean_file_path = get_clean_store_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    if (manifest_df["part"] == "base").sum() > 0 or not os.path.isfile(clean_file_path):
+        return None
+    pulled_at = datetime.fromtimestamp(os.path.getmtime(clean_file_path))
+    pulled_at = min(pulled_at, before - timedelta(seconds=1))
+    if len(manifest_df) > 0:
+        pulled_at = min(pulled_at, manifest_df["pulled_at"].min() - timedelta(seconds=1))
+    save_base_snapshot(
+        df=pd.read_parquet(clean_file_path),
+        snapshot_dir=snapshot_dir,
+        pulled_at=pulled_at,
+        id_col=id_col,
+    )
+
+
+def save_snapshot_changes(
+    inserted_df: pd.DataFrame,
+    updated_df: pd.DataFrame,
+    prior_df: pd.DataFrame,
+    snapshot_dir: os.path,
+    pulled_at: Optional[datetime] = None,
+) -> None:
+    if len(inserted_df) + len(updated_df) == 0:
+        return None
+    if pulled_at is None:
+        pulled_at = datetime.today()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    changes_file_path = get_new_snapshot_file_path(
+        snapshot_dir=snapshot_dir, part="changes", pulled_at=pulled_at
+    )
+    priors_file_path = get_new_snapshot_file_path(
+        snapshot_dir=snapshot_dir, part="priors", pulled_at=pulled_at
+    )
+    changes_df = pd.concat(
+        [inserted_df.assign(change_type="inserted"), updated_df.assign(change_type="updated")]
+    )
+    changes_df = restore_categorical_dtypes(df=changes_df, reference_df=inserted_df)
+    changes_df["change_type"] = changes_df["change_type"].astype("category")
+    changes_df.reset_index(drop=True).to_parquet(changes_file_path, compression="gzip")
+    prior_df.reset_index(drop=True).to_parquet(priors_file_path, compression="gzip")
+
+
+def load_snapshot_as_of(
+    snapshot_dir: os.path,
+    id_col: str,
+    as_of: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    if columns is not None and id_col not in columns:
+        columns = [id_col] + columns
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    base_df = manifest_df.loc[manifest_df["part"] == "base"]
+    assert len(base_df) > 0, f"No base snapshot found in {snapshot_dir}"
+    base_row = base_df.iloc[-1]
+    as_of_ts = pd.Timestamp.max if as_of is None else pd.Timestamp(as_of)
+    if as_of_ts < base_row["pulled_at"]:
+        raise ValueError(
+            f"as_of ({as_of}) predates the base snapshot ({base_row['pulled_at']}); "
+            + "it was compacted away"
+        )
+    df = pd.read_parquet(os.path.join(snapshot_dir, base_row["file_name"]), columns=columns)
+    changes_df = manifest_df.loc[
+        (manifest_df["part"] == "changes")
+        & (manifest_df["pulled_at"] > base_row["pulled_at"])
+        & (manifest_df["pulled_at"] <= as_of_ts)
+    ]
+    if len(changes_df) == 0:
+        return df
+    change_parts = [
+        pd.read_parquet(os.path.join(snapshot_dir, fn), columns=columns).drop(
+            columns=["change_type"], errors="ignore"
+        )
+        for fn in changes_df["file_name"]
+    ]
+    latest_changes_df = pd.concat(change_parts).drop_duplicates(subset=id_col, keep="last")
+    unchanged_df = df.loc[~df[id_col].isin(latest_changes_df[id_col])]
+    df_as_of = pd.concat([unchanged_df, latest_changes_df]).reset_index(drop=True)
+    df_as_of = restore_categorical_dtypes(df=df_as_of, reference_df=df)
+    return df_as_of
+
+
+def compact_snapshot_store(
+    snapshot_dir: os.path, id_col: str, as_of: Optional[str] = None
+) -> pd.DataFrame:
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    as_of_ts = pd.Timestamp.max if as_of is None else pd.Timestamp(as_of)
+    folded_df = manifest_df.loc[manifest_df["pulled_at"] <= as_of_ts]
+    if (folded_df["part"] == "changes").sum() == 0:
+        return load_snapshot_as_of(snapshot_dir=snapshot_dir, id_col=id_col, as_of=as_of)
+    df = load_snapshot_as_of(snapshot_dir=snapshot_dir, id_col=id_col, as_of=as_of)
+    save_base_snapshot(
+        df=df,
+        snapshot_dir=snapshot_dir,
+        pulled_at=folded_df["pulled_at"].max().to_pydatetime(),
+        id_col=id_col,
+    )
+    new_base_file_name = os.path.basename(
+        get_snapshot_file_path(
+            snapshot_dir=snapshot_dir,
+            part="base",
+            pulled_at=folded_df["pulled_at"].max().to_pydatetime(),
+        )
+    )
+    for file_name in folded_df["file_name"]:
+        if file_name != new_base_file_name:
+            os.remove(os.path.join(snapshot_dir, file_name))
+    return df
+
+
+def record_fresh_pull_in_snapshot_store(
+    fresh_df: pd.DataFrame,
+    id_col: str,
+    update_col: str,
     file_name: str,
     dataset_dir: str,
-    record_type: str,
     root_dir: os.path = get_project_root_dir(),
-    force_repull: bool = False,
 ) -> None:
-    assert record_type in ["updated", "new"]
-    clean_pull_dir = os.path.join(root_dir, "data_clean", dataset_dir)
-    os.makedirs(clean_pull_dir, exist_ok=True)
+    snapshot_dir = get_snapshot_dir(file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir)
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    if (manifest_df["part"] == "base").sum() == 0:
+        save_base_snapshot(df=fresh_df, snapshot_dir=snapshot_dir, id_col=id_col)
+        add_ids_to_id_index(
+            ids=fresh_df[id_col], file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+        )
+        return None
+    running_df = load_snapshot_as_of(snapshot_dir=snapshot_dir, id_col=id_col)
+    add_ids_to_id_index(
+        ids=fresh_df[id_col],
+        file_name=file_name,
+        dataset_dir=dataset_dir,
+        root_dir=root_dir,
+    )
+    prior_update_times = running_df.set_index(id_col)[update_col]
+    fresh_prior_update_times = fresh_df[id_col].map(prior_update_times)
+    inserted_mask = fresh_prior_update_times.isna()
+    updated_mask = ~inserted_mask & (fresh_df[update_col] != fresh_prior_update_times)
+    updated_df = fresh_df.loc[updated_mask]
+    save_snapshot_changes(
+        inserted_df=fresh_df.loc[inserted_mask],
+        updated_df=updated_df,
+        prior_df=running_df.loc[running_df[id_col].isin(updated_df[id_col])],
+        snapshot_dir=snapshot_dir,
+    )
 
-    today_str = datetime.today().strftime("%Y_%m_%d")
-    record_pull_file_path = os.path.join(
-        clean_pull_dir, f"{file_name}_{record_type}_records_pulled_{today_str}.parquet.gzip"
+
+def read_parquet_records_by_id(file_path: os.path, id_col: str, id_values: List) -> pd.DataFrame:
+    # row groups whose id statistics can't hold any of the ids are skipped outright; the rest
+    # are checked on their id column alone, and only those with a match are read in full
+    parquet_file = pq.ParquetFile(file_path)
+    id_col_idx = parquet_file.schema_arrow.get_field_index(id_col)
+    sorted_ids = np.sort(np.array(id_values))
+    record_parts = []
+    for row_group in range(parquet_file.metadata.num_row_groups):
+        id_stats = parquet_file.metadata.row_group(row_group).column(id_col_idx).statistics
+        if id_stats is not None and id_stats.has_min_max:
+            first_id = np.searchsorted(sorted_ids, id_stats.min, side="left")
+            if first_id >= np.searchsorted(sorted_ids, id_stats.max, side="right"):
+                continue
+        group_ids = parquet_file.read_row_group(row_group, columns=[id_col]).to_pandas()
+        id_mask = group_ids[id_col].isin(sorted_ids).to_numpy()
+        if id_mask.any():
+            group_df = parquet_file.read_row_group(row_group).to_pandas()
+            record_parts.append(group_df.loc[id_mask])
+    if len(record_parts) == 0:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return pd.concat(record_parts).reset_index(drop=True)
+
+
+def load_snapshot_records_by_id(
+    id_col: str,
+    ids: pd.Series,
+    file_name: str,
+    dataset_dir: str,
+    root_dir: os.path = get_project_root_dir(),
+) -> pd.DataFrame:
+    id_values = ids.drop_duplicates().tolist()
+    if len(id_values) == 0:
+        return pd.DataFrame(columns=[id_col])
+    snapshot_dir = get_snapshot_dir(file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir)
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    base_pulled_at = manifest_df.loc[manifest_df["part"] == "base", "pulled_at"].max()
+    if pd.isna(base_pulled_at):
+        base_pulled_at = pd.Timestamp.min
+    manifest_df = manifest_df.loc[
+        ((manifest_df["part"] == "base") & (manifest_df["pulled_at"] == base_pulled_at))
+        | ((manifest_df["part"] == "changes") & (manifest_df["pulled_at"] > base_pulled_at))
+    ]
+    record_parts = [
+        read_parquet_records_by_id(
+            file_path=os.path.join(snapshot_dir, fn), id_col=id_col, id_values=id_values
+        )
+        for fn in manifest_df["file_name"]
+    ]
+    # the id index also covers the clean store, so ids the snapshots don't hold yet are
+    # looked up there; it goes first so any snapshot version of a record wins
+    found_ids = set().union(*[set(part[id_col]) for part in record_parts])
+    missing_id_values = [id_value for id_value in id_values if id_value not in found_ids]
+    clean_file_path = get_clean_store_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
     )
-    if (record_pull_file_path not in os.listdir(clean_pull_dir)) or force_repull:
-        record_df.to_parquet(record_pull_file_path, compression="gzip")
+    if len(missing_id_values) > 0 and os.path.isfile(clean_file_path):
+        record_parts.insert(
+            0,
+            read_parquet_records_by_id(
+                file_path=clean_file_path, id_col=id_col, id_values=missing_id_values
+            ),
+        )
+    record_parts = [part for part in record_parts if len(part) > 0]
+    if len(record_parts) == 0:
+        return pd.DataFrame(columns=[id_col])
+    records_df = pd.concat(record_parts).drop(columns=["change_type"], errors="ignore")
+    records_df = records_df.drop_duplicates(subset=id_col, keep="last").reset_index(drop=True)
+    return records_df
+
+
+def get_id_index_file_path(
+    file_name: str, dataset_dir: str, root_dir: os.path = get_project_root_dir()
+) -> os.path:
+    return os.path.join(root_dir, "data_clean", dataset_dir, f"{file_name}_id_index.npy")
+
+
+def standardize_ids(ids: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(ids):
+        return ids.to_numpy(dtype="int64")
+    return np.array(ids.fillna("").astype(str).tolist(), dtype=str)
+
+
+def save_id_index(ids: pd.Series, index_file_path: os.path) -> None:
+    os.makedirs(os.path.dirname(index_file_path), exist_ok=True)
+    # write then swap, so readers holding a memmap of the old index aren't disturbed
+    tmp_file_path = f"{index_file_path}.tmp.npy"
+    np.save(tmp_file_path, np.unique(standardize_ids(ids=ids)))
+    os.replace(tmp_file_path, index_file_path)
+
+
+def build_id_index_from_stores(
+    id_col: str, file_name: str, dataset_dir: str, root_dir: os.path = get_project_root_dir()
+) -> pd.Series:
+    id_parts = []
+    clean_file_path = get_clean_store_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    if os.path.isfile(clean_file_path):
+        id_parts.append(pd.read_parquet(clean_file_path, columns=[id_col])[id_col])
+    snapshot_dir = get_snapshot_dir(file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir)
+    manifest_df = get_snapshot_manifest(snapshot_dir=snapshot_dir)
+    for fn in manifest_df.loc[manifest_df["part"].isin(["base", "changes"]), "file_name"]:
+        id_parts.append(pd.read_parquet(os.path.join(snapshot_dir, fn), columns=[id_col])[id_col])
+    if len(id_parts) == 0:
+        return pd.Series([], dtype="int64", name=id_col)
+    return pd.concat(id_parts)
+
+
+def load_id_index(
+    id_col: str,
+    file_name: str,
+    dataset_dir: str,
+    root_dir: os.path = get_project_root_dir(),
+    force_remake: bool = False,
+) -> np.ndarray:
+    index_file_path = get_id_index_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    if not os.path.isfile(index_file_path) or force_remake:
+        save_id_index(
+            ids=build_id_index_from_stores(
+                id_col=id_col, file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+            ),
+            index_file_path=index_file_path,
+        )
+    return np.load(index_file_path, mmap_mode="r")
+
+
+def add_ids_to_id_index(
+    ids: pd.Series, file_name: str, dataset_dir: str, root_dir: os.path = get_project_root_dir()
+) -> None:
+    index_file_path = get_id_index_file_path(
+        file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+    )
+    new_ids = standardize_ids(ids=ids)
+    id_index = np.load(index_file_path, mmap_mode="r") if os.path.isfile(index_file_path) else []
+    if len(id_index) > 0:
+        if id_index.dtype.kind != new_ids.dtype.kind:
+            new_ids = new_ids.astype(id_index.dtype)
+        new_ids = new_ids[~is_in_id_index(id_index=id_index, ids=new_ids)]
+        if len(new_ids) == 0:
+            return None
+        new_ids = np.concatenate([np.asarray(id_index), new_ids])
+    save_id_index(ids=pd.Series(new_ids), index_file_path=index_file_path)
+
+
+def is_in_id_index(id_index: np.ndarray, ids: Union[pd.Series, np.ndarray]) -> np.ndarray:
+    if isinstance(ids, pd.Series):
+        ids = standardize_ids(ids=ids)
+    if len(id_index) == 0:
+        return np.zeros(len(ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(id_index, ids), len(id_index) - 1)
+    return id_index[positions] == ids
 
 
 def split_new_and_updated_records_and_save_them_to_file(
     id_col: str,
-    running_df: pd.DataFrame,
+    running_df: Optional[pd.DataFrame],
     fresh_df: pd.DataFrame,
     file_name: str,
     dataset_dir: str,
     root_dir: os.path = get_project_root_dir(),
     force_repull: bool = False,
 ) -> None:
-    updates_prior_record_mask = fresh_df[id_col].isin(running_df[id_col])
+    # running_df=None classifies against the persisted id index instead of a loaded copy;
+    # force_repull no longer does anything, since change logs are never overwritten
+    if force_repull:
+        warnings.warn(
+            "force_repull is deprecated and ignored; snapshot change logs are never overwritten",
+            DeprecationWarning,
+        )
+    if running_df is not None:
+        updates_prior_record_mask = fresh_df[id_col].isin(running_df[id_col]).to_numpy()
+    else:
+        id_index = load_id_index(
+            id_col=id_col, file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+        )
+        updates_prior_record_mask = is_in_id_index(id_index=id_index, ids=fresh_df[id_col])
     updated_records_df = fresh_df.loc[updates_prior_record_mask].copy()
     new_records_df = fresh_df.loc[~updates_prior_record_mask].copy()
 
-    save_fresh_records_to_file(
-        record_df=new_records_df,
+    snapshot_dir = get_snapshot_dir(file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir)
+    pulled_at = datetime.today()
+    seed_base_snapshot_from_clean_store(
+        id_col=id_col,
         file_name=file_name,
         dataset_dir=dataset_dir,
-        record_type="new",
+        before=pulled_at,
         root_dir=root_dir,
-        force_repull=force_repull,
     )
-    save_fresh_records_to_file(
-        record_df=updated_records_df,
-        file_name=file_name,
-        dataset_dir=dataset_dir,
-        record_type="updated",
-        root_dir=root_dir,
-        force_repull=force_repull,
+    if running_df is not None:
+        prior_df = running_df.loc[running_df[id_col].isin(updated_records_df[id_col])]
+    else:
+        prior_df = load_snapshot_records_by_id(
+            id_col=id_col,
+            ids=updated_records_df[id_col],
+            file_name=file_name,
+            dataset_dir=dataset_dir,
+            root_dir=root_dir,
+        )
+    save_snapshot_changes(
+        inserted_df=new_records_df,
+        updated_df=updated_records_df,
+        prior_df=prior_df,
+        snapshot_dir=snapshot_dir,
+        pulled_at=pulled_at,
+    )
+    add_ids_to_id_index(
+        ids=new_records_df[id_col], file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
     )
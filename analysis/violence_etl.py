@@ -1,10 +1,11 @@
-from datetime import datetime
 import os
+from typing import Optional
 
 import pandas as pd
 import geopandas as gpd
 
 from utils import (
+    CLEAN_STORE_ROW_GROUP_SIZE,
     get_project_root_dir,
     extract_file_from_url,
     make_point_geometry,
@@ -23,6 +24,11 @@ from utils import (
     get_number_of_results_for_socrata_query,
     typeset_ordered_categorical_feature,
     standardize_mistakenly_int_parsed_categorical_series,
+    record_fresh_pull_in_snapshot_store,
+    split_new_and_updated_records_and_save_them_to_file,
+    add_ids_to_id_index,
+    compact_dataframe,
+    read_parquet_without_geometry,
 )
 
 
@@ -114,10 +120,24 @@ def transform_homicide_and_nfs_data(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def compact_homicide_and_nfs_data(
+    df: pd.DataFrame, report_memory_usage: bool = True
+) -> pd.DataFrame:
+    df = compact_dataframe(
+        df=df,
+        string_columns=["case_number", "unique_id"],
+        dictionary_columns=["block"],
+        boolean_columns=["gunshot_injury_i"],
+        report_memory_usage=report_memory_usage,
+    )
+    return df
+
+
 def load_clean_chicago_homicides_and_nonfatal_shootings_data(
     root_dir: os.path = get_project_root_dir(),
     force_repull: bool = False,
     force_remake: bool = False,
+    compact: bool = False,
 ) -> pd.DataFrame:
     file_name = "Violence_Reduction_-_Victims_of_Homicides_and_Non-Fatal_Shootings"
     dataset_dir = "homicides_and_shootings"
@@ -130,21 +150,32 @@ def load_clean_chicago_homicides_and_nonfatal_shootings_data(
                 root_dir=root_dir, force_repull=force_repull
             )
         )
-        df.to_parquet(clean_file_path, compression="gzip")
+        df.to_parquet(
+            clean_file_path, compression="gzip", row_group_size=CLEAN_STORE_ROW_GROUP_SIZE
+        )
+        add_ids_to_id_index(
+            ids=df["unique_id"], file_name=file_name, dataset_dir=dataset_dir, root_dir=root_dir
+        )
         if force_repull:
-            today_str = datetime.today().strftime("%Y_%m_%d")
-            repull_file_name = f"{file_name}_full_pull_from_{today_str}.parquet.gzip"
-            clean_repull_file_path = os.path.join(
-                os.path.dirname(clean_file_path), repull_file_name
+            record_fresh_pull_in_snapshot_store(
+                fresh_df=df,
+                id_col="unique_id",
+                update_col="updated",
+                file_name=file_name,
+                dataset_dir=dataset_dir,
+                root_dir=root_dir,
             )
-            df.to_parquet(clean_repull_file_path, compression="gzip")
+    elif compact:
+        df = read_parquet_without_geometry(file_path=clean_file_path)
     else:
         df = pd.read_parquet(clean_file_path)
+    if compact:
+        df = compact_homicide_and_nfs_data(df=df)
     return df
 
 
 def split_new_and_updated_homicide_and_shooting_records_and_save_them_to_file(
-    running_df: pd.DataFrame,
+    running_df: Optional[pd.DataFrame],
     fresh_df: pd.DataFrame,
     root_dir: os.path = get_project_root_dir(),
     force_repull: bool = False,